@@ -10,7 +10,7 @@ import logging
 
 from apify.log import ActorLogFormatter
 
-from .baanreserveren import main
+from .baanreserveren import RUN_TIMEOUT, main
 
 # Configure loggers
 handler = logging.StreamHandler()
@@ -24,7 +24,7 @@ apify_logger = logging.getLogger("apify")
 apify_logger.setLevel(logging.DEBUG)
 apify_logger.addHandler(handler)
 
-main_logger = logging.getLogger("src.baanreserveren")
+main_logger = logging.getLogger("src")
 main_logger.setLevel(logging.DEBUG)
 main_logger.addHandler(handler)
 
@@ -32,8 +32,9 @@ main_logger.addHandler(handler)
 
 
 async def run_main_on_timeout():
-    async with asyncio.timeout(3 * 60):
-        await main()
+    # main() extends the timeout when the booking waits for a release instant
+    async with asyncio.timeout(RUN_TIMEOUT.total_seconds()) as timeout:
+        await main(timeout=timeout)
 
 
 asyncio.run(run_main_on_timeout())
@@ -0,0 +1,226 @@
+"""
+Reservation history archive: one compact, gzip-compressed partition per month plus an index.
+
+Months before the current one are sealed, their partitions are written once and never rewritten. A run only writes the
+partitions of the current and the coming months (the ones the scrape can still change) and the index, and only when
+their content changed.
+
+The full feeds still need every sealed reservation, so those are also kept together in one sealed snapshot. A run
+reads the index, the snapshot and the partitions from the current month on. Only when months got sealed since the last
+run, their partitions are read once more to extend the snapshot. The snapshot records the last month it holds itself,
+so a run that fails between writing the snapshot and the index never adds those months twice. The number of requests
+of a run stays the same however long the history gets, but the snapshot still grows with it and is read in full on
+every run, about a few kB compressed per year of reservations. The first run without
+an index migrates the old `<prefix>/reservations.json` history into partitions. All keys live under the calendar prefix
+of the account, see `Settings.calendar_prefix`.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+
+from src.manifest import content_hash
+from src.storage import is_missing, load_bytes_from_s3, upload_bytes_to_s3
+from src.tracing import traced
+
+log = logging.getLogger(__name__)
+
+
+def index_key(prefix: str) -> str:
+    return f"{prefix}/history/index.json"
+
+
+def partition_key(prefix: str, month: str) -> str:
+    return f"{prefix}/history/{month}.json.gz"
+
+
+def sealed_key(prefix: str) -> str:
+    return f"{prefix}/history/sealed.json.gz"
+
+
+def legacy_history_key(prefix: str) -> str:
+    # The history used to be stored as the pretty printed feed of all players
+    return f"{prefix}/reservations.json"
+
+
+def month_of(reservation: dict) -> str:
+    day, month, year = reservation["datum"].split("-")
+    return f"{year}-{month}"
+
+
+def encode_partition(reservations: list[dict]) -> bytes:
+    ordered = sorted(
+        reservations,
+        key=lambda reservation: (month_of(reservation), reservation["datum"][:2], reservation["begintijd"]),
+    )
+    content = json.dumps(ordered, separators=(",", ":"), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    # A fixed mtime keeps the bytes, and so the hash, the same for the same reservations
+    return gzip.compress(content, mtime=0)
+
+
+def decode_partition(content: bytes) -> list[dict]:
+    return json.loads(gzip.decompress(content).decode("utf-8"))
+
+
+def encode_snapshot(reservations: list[dict], sealed_through: str) -> bytes:
+    content = json.dumps(
+        {"sealed_through": sealed_through, "reservations": reservations},
+        separators=(",", ":"),
+        sort_keys=True,
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return gzip.compress(content, mtime=0)
+
+
+def decode_snapshot(content: bytes) -> tuple[list[dict], str]:
+    data = json.loads(gzip.decompress(content).decode("utf-8"))
+    return data["reservations"], data["sealed_through"]
+
+
+@dataclass
+class Index:
+    partitions: dict[str, dict] = field(default_factory=dict)
+    # The last month in the sealed snapshot
+    sealed_through: str | None = None
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "Index":
+        data = json.loads(content.decode("utf-8"))
+        return cls(partitions=data["partitions"], sealed_through=data.get("sealed_through"))
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(
+            {"partitions": self.partitions, "sealed_through": self.sealed_through}, indent=4, sort_keys=True
+        ).encode("utf-8")
+
+    def months(self, since: str | None = None) -> list[str]:
+        return sorted(month for month in self.partitions if since is None or month >= since)
+
+
+def split_by_month(reservations: list[dict]) -> dict[str, list[dict]]:
+    months: dict[str, list[dict]] = {}
+    for reservation in reservations:
+        months.setdefault(month_of(reservation), []).append(reservation)
+    return months
+
+
+async def write_partitions(bucket: str, prefix: str, index: Index, reservations: list[dict], months: set[str]) -> bool:
+    """Write the partitions of `months` whose content changed, returns whether the index changed"""
+    by_month = split_by_month(reservations)
+    uploads = []
+
+    for month in sorted(months):
+        content = encode_partition(by_month.get(month, []))
+        entry = {"count": len(by_month.get(month, [])), "sha256": content_hash(content), "size": len(content)}
+        if index.partitions.get(month) == entry:
+            continue
+        if not entry["count"] and month not in index.partitions:
+            continue
+
+        index.partitions[month] = entry
+        uploads.append(
+            upload_bytes_to_s3(
+                partition_key(prefix, month), content, "application/json", bucket=bucket, ContentEncoding="gzip"
+            )
+        )
+
+    await asyncio.gather(*uploads)
+    return bool(uploads)
+
+
+async def migrate(bucket: str, prefix: str) -> Index:
+    """Split the old history file into monthly partitions"""
+    try:
+        content = await load_bytes_from_s3(legacy_history_key(prefix), bucket=bucket)
+        # The data files were stored gzip encoded for a while
+        if content[:2] == b"\x1f\x8b":
+            content = gzip.decompress(content)
+        legacy = json.loads(content.decode("utf-8"))
+    except Exception as e:
+        if not is_missing(e):
+            raise
+        log.warning("No stored reservations found, starting an empty archive")
+        legacy = []
+
+    index = Index()
+    by_month = split_by_month(legacy)
+    await write_partitions(bucket, prefix, index, legacy, set(by_month))
+    await upload_bytes_to_s3(index_key(prefix), index.to_bytes(), "application/json", bucket=bucket)
+    log.info("Migrated %s reservations into %s monthly partitions", len(legacy), len(by_month))
+    return index
+
+
+async def load_partitions(bucket: str, prefix: str, index: Index, months: list[str]) -> list[dict]:
+    partitions = await asyncio.gather(
+        *[
+            load_bytes_from_s3(partition_key(prefix, month), bucket=bucket)
+            for month in months
+            if index.partitions[month]["count"]
+        ]
+    )
+    return [reservation for partition in partitions for reservation in decode_partition(partition)]
+
+
+async def load_sealed(bucket: str, prefix: str, index: Index, current: str) -> list[dict]:
+    """The reservations of the months before `current`, extending the snapshot with the months sealed since"""
+    sealed, sealed_through = [], None
+    if index.sealed_through is not None:
+        # The snapshot may be ahead of the index, when the index failed to upload after it
+        sealed, sealed_through = decode_snapshot(await load_bytes_from_s3(sealed_key(prefix), bucket=bucket))
+
+    newly_sealed = [
+        month for month in index.months() if month < current and (sealed_through is None or month > sealed_through)
+    ]
+    if not newly_sealed:
+        index.sealed_through = sealed_through
+        return sealed
+
+    sealed += await load_partitions(bucket, prefix, index, newly_sealed)
+    await upload_bytes_to_s3(
+        sealed_key(prefix),
+        encode_snapshot(sealed, newly_sealed[-1]),
+        "application/json",
+        bucket=bucket,
+        ContentEncoding="gzip",
+    )
+    index.sealed_through = newly_sealed[-1]
+    await upload_bytes_to_s3(index_key(prefix), index.to_bytes(), "application/json", bucket=bucket)
+    log.info("Sealed %s into the snapshot of %s reservations", ", ".join(newly_sealed), len(sealed))
+    return sealed
+
+
+@traced()
+async def load_history(bucket: str, prefix: str, today: date | None = None) -> tuple[Index, list[dict]]:
+    """The index and all reservations: the sealed ones from the snapshot, the others from their partitions"""
+    current = (today or date.today()).strftime("%Y-%m")
+    try:
+        index = Index.from_bytes(await load_bytes_from_s3(index_key(prefix), bucket=bucket))
+    except Exception as e:
+        # Any other error must not end up in a migration that overwrites the partitions
+        if not is_missing(e):
+            raise
+        log.info("No history index found, migrating the old history")
+        index = await migrate(bucket, prefix)
+
+    sealed, recent = await asyncio.gather(
+        load_sealed(bucket, prefix, index, current),
+        load_partitions(bucket, prefix, index, index.months(current)),
+    )
+    log.info("Loaded %s sealed and %s recent reservations", len(sealed), len(recent))
+    return index, sealed + recent
+
+
+@traced()
+async def save_history(bucket: str, prefix: str, index: Index, reservations: list[dict], today: date):
+    """Write the partitions that can still change, from the month of `today` on, and the index if it changed"""
+    current = today.strftime("%Y-%m")
+    months = {month for month in split_by_month(reservations) if month >= current}
+    months |= {month for month in index.partitions if month >= current}
+
+    if await write_partitions(bucket, prefix, index, reservations, months):
+        await upload_bytes_to_s3(index_key(prefix), index.to_bytes(), "application/json", bucket=bucket)
+    else:
+        log.info("History unchanged, nothing to write")
@@ -8,41 +8,97 @@ https://docs.apify.com/sdk/python
 """
 
 import asyncio
-import json
 import logging
+import time
 from itertools import zip_longest
 from datetime import datetime, timedelta
-from multiprocessing import Value
-import uuid
+from dataclasses import dataclass, field
 
 # Apify SDK - toolkit for building Apify Actors, read more at https://docs.apify.com/sdk/python
 from apify import Actor
-from icalendar import Calendar, Event, Timezone, TimezoneDaylight, TimezoneStandard, vCalAddress, vText
-
-import boto3
 
 # We use playwright for scraping, read more at https://playwright.dev/python/docs/api/class-playwright
-from playwright.async_api import Page, async_playwright
-import pytz
+from playwright.async_api import Page, Playwright, async_playwright
 
 # We use pydantic for parsing te input and loading the environment variables, read more at https://pydantic-docs.helpmanual.io/
 
-from src.models import Input, Settings
-from src.utils import to_snake_case
+from src.browser import (
+    LEAN_LAUNCH_ARGS,
+    context_get,
+    install_request_blocking,
+    report_page_loads,
+    start_browser_trace,
+    stop_browser_trace,
+)
+from src.matrix import (
+    MATRIX_SCRIPT,
+    Cell,
+    Matrix,
+    build_matrix,
+    is_excluded,
+    log_ranking,
+    parse_matrix_html,
+    rank_cells,
+    to_candidates,
+)
+from src.models import Input, Registry, Settings
+from src.racing import Candidate, Race, run_race
+from src.release import release_instant, run_budget, sleep_until_prearm, wait_for_release
+from src.session import load_session, save_session
+from src.steps import deadline_at, retry_step
+from src.tracing import current_tracer, span, trace_run, traced
+from src.waits import StepTimeout, wait_for_function, wait_for_selector
+from src.watcher import WatchExpired, watch_for_cancellations
 
 
 log = logging.getLogger(__name__)
 print(log.name)
 
-URL_LOGIN = "https://squtrecht.baanreserveren.nl/"
-URL_RESERVATIONS = "https://squtrecht.baanreserveren.nl/user/future"
-CALENDAR_BUCKET = "apify-squash-utrecht"
+URL_BASE = "https://squtrecht.baanreserveren.nl"
+PATH_LOGIN = "/"
+PATH_RESERVATIONS = "/user/future"
+# The day matrix and the reservation form opened by clicking one of its cells
+PATH_MATRIX = "/reservations/{date}"
+PATH_MAKE = "/reservations/make/{resource}/{slot}"
 DEVICE = "Desktop Chrome"
-OPPONENTS = {
-    "vera": "1409256",
-    "koen": "1340920",
-    "jeroen": "1148695",
-}
+# How long a run may take, counted from the release instant when the booking is pre-armed
+RUN_TIMEOUT = timedelta(minutes=3)
+
+
+class NoSlotError(Exception):
+    """Raised when none of the preferred slots could be booked"""
+
+
+def site_url(settings: Settings, path: str) -> str:
+    return (settings.base_url or URL_BASE) + path
+
+
+@dataclass
+class Progress:
+    """How far the booking of a slot got, so a retry picks up from there"""
+
+    # Cells that were opened already, a retry only probes the others
+    tried: set[Cell] = field(default_factory=set)
+    selected: Cell | None = None
+
+
+def step_timeouts(settings: Settings) -> dict[str, float]:
+    """The worst case seconds of the booking steps, in the order they run"""
+    return {
+        "session": settings.login_timeout,
+        "date": settings.date_timeout,
+        "slot": settings.slot_timeout,
+        "confirm": settings.submit_timeout,
+        "commit": settings.submit_timeout,
+    }
+
+
+async def booking_step(settings: Settings, step: str, action, recover=None):
+    """Run a step of the booking, retried from the last checkpoint while the steps after it still fit the deadline"""
+    timeouts = step_timeouts(settings)
+    steps = list(timeouts)
+    after = sum(timeouts[name] for name in steps if steps.index(name) > steps.index(step))
+    return await retry_step(step, action, recover, cost=timeouts[step], after=after, retries=settings.step_retries)
 
 
 def ordered_times(args: Input) -> list[timedelta]:
@@ -57,8 +113,9 @@ def ordered_times(args: Input) -> list[timedelta]:
     ]
 
 
+@traced()
 async def login(settings: Settings, page: Page):
-    await page.goto(URL_LOGIN)
+    await page.goto(site_url(settings, PATH_LOGIN))
 
     await page.fill('#login-form input[type="email"]', settings.username)
     await page.fill('#login-form input[type="password"]', settings.password)
@@ -66,14 +123,56 @@ async def login(settings: Settings, page: Page):
     await page.click("#login-form button")
 
     # Wait until we have been redirected to the my-account page
-    for _ in range(20):
-        if await page.query_selector_all('a[href="/auth/logout"]'):
-            break
-        await asyncio.sleep(0.5)
-    else:
-        raise Exception("Login failed")
+    try:
+        waited = await wait_for_selector(page, 'a[href="/auth/logout"]', "login", settings.login_timeout, "attached")
+    except StepTimeout as e:
+        raise Exception("Login failed") from e
+
+    log.info("Succesfully logged in after %.0f ms", waited * 1000)
+
 
-    log.info("Succesfully logged in")
+@traced()
+async def ensure_logged_in(settings: Settings, page: Page):
+    """Reuse the cached session of the context when it is still logged in, log in otherwise"""
+    if await page.context.cookies():
+        response = await context_get(page.context, site_url(settings, PATH_LOGIN))
+        if 'href="/auth/logout"' in await response.text():
+            log.info("Reusing the cached session")
+            return
+
+        log.info("Cached session expired, logging in again")
+
+    await login(settings, page)
+    await save_session(settings, await page.context.storage_state())
+
+
+async def shows_date(page: Page, date: datetime) -> bool:
+    """Whether the page shows the matrix of the date, without waiting for it"""
+    title = await page.query_selector("#matrix_date_title")
+    if title is None or not await page.query_selector("tr[data-time]"):
+        return False
+
+    try:
+        return datetime.strptime((await title.text_content()).split(" ")[1], "%d-%m-%Y").date() == date.date()
+    except (IndexError, ValueError):
+        return False
+
+
+async def back_to_matrix(settings: Settings, args: Input, page: Page):
+    """Recover to the checkpoint of the date: only log in or navigate again when that got lost"""
+    if await shows_date(page, target_date(args)):
+        popup = await page.query_selector('a[tooltip="Sluiten"]')
+        if popup is None:
+            return
+        try:
+            await popup.click()
+            await wait_for_selector(page, 'td.tblTitle:has-text("Baan")', "slot", settings.slot_timeout, "detached")
+            return
+        except Exception:
+            log.info("Closing the popup failed, opening the date again")
+
+    await ensure_logged_in(settings, page)
+    await select_date(settings, args, page)
 
 
 async def read_date(page: Page) -> datetime:
@@ -83,7 +182,12 @@ async def read_date(page: Page) -> datetime:
     return current_date
 
 
-async def select_date(settings: Settings, args: Input, page: Page):
+def check_opponent(settings: Settings, args: Input):
+    if args.opponent not in settings.opponents:
+        raise ValueError(f"Unknown opponent {args.opponent}, use one of {', '.join(settings.opponents)}")
+
+
+def target_date(args: Input) -> datetime:
     if args.reservation_date is None:
         log.info("No reservation date specified")
 
@@ -102,10 +206,37 @@ async def select_date(settings: Settings, args: Input, page: Page):
     if date.date().strftime("%Y-%m-%d") in args.reservation_skip:
         raise ValueError("Requested date is in the skip list")
 
-    current_date = await read_date(page)
+    return date
+
+
+@traced()
+async def select_date(settings: Settings, args: Input, page: Page):
+    date = target_date(args)
+
+    # Jump straight to the matrix of the date, the page is ready once the matrix rows are rendered
+    response = await page.goto(site_url(settings, PATH_MATRIX.format(date=date.strftime("%Y-%m-%d"))))
+    if response is not None and response.ok and await page.query_selector("#matrix_date_title"):
+        await wait_for_selector(page, "tr[data-time]", "date", settings.date_timeout, "attached")
+        current_date = await read_date(page)
+    else:
+        current_date = None
+
+    if current_date is None or current_date.date() != date.date():
+        log.info("Direct navigation to %s failed, clicking through the days instead", date.strftime("%Y-%m-%d"))
+        await page.goto(site_url(settings, PATH_LOGIN))
+        await wait_for_selector(page, "#matrix_date_title", "date", settings.date_timeout, "attached")
+        current_date = await read_date(page)
+
     while current_date.date() < date.date():
+        title = await page.text_content("#matrix_date_title")
         await page.click('a.matrix-date-nav[data-offset="+1"]')
-        await asyncio.sleep(0.5)
+        await wait_for_function(
+            page,
+            "title => document.querySelector('#matrix_date_title')?.textContent !== title",
+            "date",
+            settings.date_timeout,
+            arg=title,
+        )
         current_date = await read_date(page)
 
     log.info(
@@ -115,352 +246,337 @@ async def select_date(settings: Settings, args: Input, page: Page):
     )
 
 
-async def select_slot(settings: Settings, args: Input, page: Page):
-    times = ordered_times(args)
-    await asyncio.sleep(0.5)
-    for time in times:
-        slots = await page.locator(f'tr[data-time="{time}"] td[type="free"]').all()
+async def read_matrix(settings: Settings, page: Page) -> Matrix:
+    await wait_for_selector(page, "tr[data-time]", "slot", settings.slot_timeout, "attached")
+    return build_matrix(await page.evaluate(MATRIX_SCRIPT))
 
-        if len(slots) == 0:
-            log.info("No slots available at %s", time)
-            continue
 
-        if args.leden_only:
-            # For members only we want the hall in the back to have preference
-            slots = slots[::-1]
+@traced()
+async def open_slot(settings: Settings, page: Page, cell: Cell) -> str:
+    """Click the cell and return the court shown in the popup"""
+    await page.locator(f'tr[data-time="{cell.time}"] > td').nth(cell.column).click()
+    await wait_for_selector(page, 'td.tblTitle:has-text("Baan")', "slot", settings.slot_timeout)
+
+    row = page.locator('td.tblTitle:has-text("Baan")').locator("..")
+    return (await row.locator("td").nth(1).text_content()).strip()
 
-        for slot in slots:
-            await slot.click()
 
-            row = page.locator('td.tblTitle:has-text("Baan")').locator("..")
-            court = await row.locator("td").nth(1).text_content()
+@traced()
+async def select_slot(settings: Settings, args: Input, page: Page, progress: Progress | None = None):
+    progress = progress or Progress()
+    # Rank the whole matrix up front, so only the winning cell gets clicked
+    ranked = rank_cells(await read_matrix(settings, page), args, ordered_times(args))
+    log_ranking(ranked)
+
+    for ranked_cell in ranked:
+        if ranked_cell.cell in progress.tried:
+            continue
+        progress.tried.add(ranked_cell.cell)
 
-            if court.strip().lower().startswith("court 1 "):
-                # Court 1 needs to be booked via the reception
-                await page.click('a[tooltip="Sluiten"]')
-                log.info("Skipping court 1 slot at %s", time)
-            else:
-                log.info("Selected one of the %s slots available at %s", len(slots), time)
-                return True
+        court = await open_slot(settings, page, ranked_cell.cell)
+
+        if is_excluded(court, args):
+            # The matrix header didn't tell, but the popup shows an excluded court
+            await page.click('a[tooltip="Sluiten"]')
+            await wait_for_selector(page, 'td.tblTitle:has-text("Baan")', "slot", settings.slot_timeout, "detached")
+            log.info("Skipping %s at %s", court, ranked_cell.cell.time)
+        else:
+            log.info("Selected %s", ranked_cell.describe())
+            progress.selected = ranked_cell.cell
+            return True
 
     return False
 
 
-async def place_reservation(settings: Settings, args: Input, page: Page):
-    await page.select_option('select[name="players[2]"]', value=OPPONENTS[args.opponent])
+@traced()
+async def confirm_reservation(settings: Settings, args: Input, page: Page):
+    await page.select_option('select[name="players[2]"]', value=settings.opponents[args.opponent])
     await page.click('input#__make_submit[type="submit"]')
+    await wait_for_selector(page, 'input#__make_submit2[type="submit"]', "submit", settings.submit_timeout)
 
+
+@traced()
+async def commit_reservation(settings: Settings, args: Input, page: Page):
     if not settings.dry_run and not args.dry_run:
         await page.click('input#__make_submit2[type="submit"]')
+        # The confirmation form is gone once the site handled the submit, open requests of the next page don't matter
+        await wait_for_selector(
+            page, 'input#__make_submit2[type="submit"]', "submit", settings.submit_timeout, "detached"
+        )
         log.info("Succesfully placed the reservation with %s", args.opponent)
     else:
         log.info("[DRY RUN] Not actually placing the reservation")
-        await asyncio.sleep(1)
-
-    return True
-
-
-async def run_reserver(settings: Settings, args: Input, page: Page):
-    await login(settings, page)
-    await select_date(settings, args, page)
-    success = await select_slot(settings, args, page)
 
-    if not success:
-        raise Exception("Failed to select a slot")
 
-    success = await place_reservation(settings, args, page)
+async def place_reservation(settings: Settings, args: Input, page: Page):
+    await confirm_reservation(settings, args, page)
+    await commit_reservation(settings, args, page)
 
-    if not success:
-        raise Exception("Failed to place reservation")
+    return True
 
-    log.info("Placed reservation successfully")
 
+@traced()
+async def race_slots(settings: Settings, args: Input, page: Page) -> bool:
+    """Race the free slots on separate pages of the logged in context and book the first one that gets through"""
 
-async def get_future_reservations(page: Page) -> list[dict]:
-    await page.goto(URL_RESERVATIONS)
+    async def attempt(candidate: Candidate, race: Race) -> bool:
+        racer = await page.context.new_page()
+        try:
+            await select_date(settings, args, racer)
+            race.mark(candidate, "date selected")
 
-    reservations_locator = page.locator(
-        "//th[contains(text(), 'Reserveringen')]/ancestor::tbody/tr[@class='odd' or @class='even']"
-    )
+            court = await open_slot(settings, racer, candidate.slot)
+            if is_excluded(court, args):
+                race.mark(candidate, f"skipped {court}")
+                return False
+            race.mark(candidate, f"opened {court}")
 
-    log.info("Found %s reservations", await reservations_locator.count())
-    headers = [
-        to_snake_case(header)
-        for header in await page.locator(
-            "//th[contains(text(), 'Reserveringen')]/ancestor::tbody/tr[@class='tblTitle'][1]/td"
-        ).all_inner_texts()
-    ]
+            await confirm_reservation(settings, args, racer)
+            race.mark(candidate, "confirmation step")
 
-    reservations = []
-    for reservation_index in range(await reservations_locator.count()):
-        reservation = {
-            header: value.strip()
-            for header, value in zip(
-                headers,
-                await reservations_locator.nth(reservation_index).locator("td").all_inner_texts(),
-            )
-        }
+            if not race.claim(candidate):
+                return False
 
-        await reservations_locator.nth(reservation_index).locator("a").click()
-        await page.wait_for_selector("//*[contains(text(), 'Speler 1')]")
-
-        reservation["spelers"] = await page.locator("//div[@class='res-info-player-name']").all_inner_texts()
-        reservations.append(reservation)
-
-        await page.click("//input[@value='Terug']")
-
-    return reservations
-
-
-async def create_calendar(reservations: list[dict], player: str):
-    # Create a calendar
-    cal = Calendar()
-
-    # Add some properties to the calendar
-    cal.add("prodid", "-//Jeroen Squash Utrecht//mxm.dk//")
-    cal.add("version", "2.0")
-    cal.add("x-wr-calname", "Squash Reserveringen")
-
-    # Create a VTIMEZONE component for Europe/Amsterdam
-    tz = Timezone()
-    tz.add("tzid", "Europe/Amsterdam")
-    tz.add("x-lic-location", "Europe/Amsterdam")
-
-    # Standard Time Component (assuming standard time here, adjust as necessary)
-    std = TimezoneStandard()
-    std.add("dtstart", datetime(1970, 10, 25, 3, 0, 0))
-    std.add("tzoffsetfrom", timedelta(hours=2))
-    std.add("tzoffsetto", timedelta(hours=1))
-    std.add("tzname", "CET")
-    tz.add_component(std)
-
-    # Daylight Saving Time Component (if applicable, adjust as necessary)
-    dst = TimezoneDaylight()
-    dst.add("dtstart", datetime(1970, 3, 29, 2, 0, 0))
-    dst.add("tzoffsetfrom", timedelta(hours=1))
-    dst.add("tzoffsetto", timedelta(hours=2))
-    dst.add("tzname", "CEST")
-    tz.add_component(dst)
-
-    # Add the VTIMEZONE component to your calendar before adding events
-    cal.add_component(tz)
-
-    amsterdam_tz = pytz.timezone("Europe/Amsterdam")
-
-    for reservation in reservations:
-        event = Event()
-
-        # Parse date and time
-        date_str = reservation["datum"] + " " + reservation["begintijd"]
-        start_datetime = amsterdam_tz.localize(datetime.strptime(date_str, "%d-%m-%Y %H:%M"))
-        # Assuming the duration of each reservation is 1 hour
-        end_datetime = start_datetime + timedelta(minutes=45)
-
-        # Format summary
-        summary = f"{reservation['baan']} 🏆⚫️"
-
-        # Set event properties
-        event.add("summary", summary)
-        event.add("dtstart", start_datetime)
-        event.add("dtend", end_datetime)
-        event.add("location", "Squash Utrecht, Taagdreef 130, 3561 VL Utrecht")
-        event.add("url", f"https://squtrecht.baanreserveren.nl/user/{OPPONENTS[player]}/future")
-
-        if "spelers" in reservation:
-            event.add("description", "Spelers: " + ", ".join(reservation["spelers"]))
-            for speler in reservation["spelers"]:
-                # Adding attendees
-                attendee = vCalAddress("MAILTO:jeroenbosleusden@mail.com")
-                attendee.params["cn"] = vText(speler)
-                attendee.params["ROLE"] = vText("REQ-PARTICIPANT")
-                event.add("attendee", attendee, encode=0)
-
-        # Generate a UID for each event, for example using the start datetime and court number
-        uid = f"squash-{reservation['datum'].replace('-', '')}-{reservation['begintijd'].replace(':', '')}-{reservation['baan'].replace(' ', '')}@example.com"
-        event.add("uid", uid)
-
-        # Add the current timestamp as dtstamp
-        event.add("dtstamp", datetime.now())
-
-        # Setting status and transparency
-        event.add("status", "CONFIRMED")
-        event.add("transp", "OPAQUE")
-
-        # Increment number to invalidate old values
-        event.add("sequence", int(datetime.now().strftime("%Y%m%d")))
-
-        # Add the event to the calendar
-        cal.add_component(event)
-        event_type = "placeholder" if "placeholder" in reservation["baan"].lower() else "reservation"
-        log.info("Added %s for %s to calendar", event_type, start_datetime.strftime("%Y-%m-%d %H:%M"))
-
-    return cal
-
-
-def generate_placeholders(start: datetime, placeholder_weeks: int) -> list[dict]:
-    # Generate mondays and thursdays
-    weekday = start.weekday()
+            await commit_reservation(settings, args, racer)
+            race.mark(candidate, "committed")
+            return True
+        finally:
+            await racer.close()
 
-    if start.weekday() < 2:
-        next_wednesday = start + timedelta(days=(2 - weekday))
-        placeholder_days_in_week = [
-            datetime(next_wednesday.year, next_wednesday.month, next_wednesday.day, 20, 30),
-            datetime(next_wednesday.year, next_wednesday.month, next_wednesday.day, 20, 30) + timedelta(days=5),
-        ]
-    else:
-        next_monday = start + timedelta(days=(7 - weekday))
-        placeholder_days_in_week = [
-            datetime(next_monday.year, next_monday.month, next_monday.day, 20, 30),
-            datetime(next_monday.year, next_monday.month, next_monday.day, 20, 30) + timedelta(days=2),
-        ]
-
-    placeholders = []
-
-    for i in range(placeholder_weeks):
-        for day in placeholder_days_in_week:
-            placeholders.append(
-                {
-                    "datum": (day + timedelta(weeks=i)).strftime("%d-%m-%Y"),
-                    "weekdag": day.strftime("%A"),
-                    "begintijd": "20:30",
-                    "baan": "🚧 Placeholder",
-                    "spelers": ["Jeroen Bos", "Vera Sweere"],
-                }
-            )
-
-    return placeholders
-
-
-async def combine_with_old_reservations(reservations_key, future_reservations, player: str = None):
-    previous_reservations = json.loads((await load_bytes_from_s3(reservations_key)).decode("utf-8"))
-    today = datetime.now().date()
-    previous_reservations = [
-        reservation
-        for reservation in previous_reservations
-        if datetime.strptime(reservation["datum"], "%d-%m-%Y").date() < today
-    ]
+    ranked = rank_cells(await read_matrix(settings, page), args, ordered_times(args))
+    log_ranking(ranked)
+    candidates = to_candidates(ranked)
+    if not candidates:
+        log.info("No slots available at %s", ", ".join(ordered_times(args)))
+        return False
 
-    if player is not None:
-        future_reservations = [
-            reservation
-            for reservation in future_reservations
-            if any(player in p.lower() for p in reservation["spelers"])
-        ]
+    return await run_race(candidates, attempt, concurrency=args.race_concurrency) is not None
 
-    reservations = previous_reservations + future_reservations
-    log.info(
-        "Combined %s previous and %s future reservations with a resulting %s reservations",
-        len(previous_reservations),
-        len(future_reservations),
-        len(reservations),
-    )
 
-    return reservations
+async def run_reserver(settings: Settings, args: Input, page: Page):
+    # A retry of the login only logs in again when the session is gone
+    await booking_step(settings, "session", lambda: ensure_logged_in(settings, page))
+    await reserve(settings, args, page)
+
+
+async def reserve(settings: Settings, args: Input, page: Page):
+    """Book a slot on the date of the input, on a page of a logged in context"""
+    check_opponent(settings, args)
+    await open_date(settings, args, page)
+
+    release = release_instant(args)
+    if release is not None:
+        await wait_for_release(
+            release,
+            keep_warm=lambda: context_get(page.context, site_url(settings, PATH_LOGIN)),
+            keep_warm_seconds=args.keep_warm_seconds,
+        )
+        # Unlike in the http engine, nothing can be ranked ahead here: the cells of the matrix only become clickable
+        # when the released matrix is loaded, so pre-arming the browser saves the launch and the login, not this load
+        await open_date(settings, args, page)
 
+    if not await book_slot(settings, args, page):
+        if not args.watch_minutes:
+            raise NoSlotError("Failed to select a slot")
+        if not await watch_in_browser(settings, args, page):
+            raise WatchExpired("No slot freed up while watching")
 
-async def upload_bytes_to_s3(key, bytes, content_type):
-    s3_client = boto3.client("s3")
-    try:
+    log.info("Placed reservation successfully on %s", target_date(args).strftime("%Y-%m-%d"))
 
-        def _upload():
-            s3_client.put_object(
-                Bucket=CALENDAR_BUCKET,
-                Key=key,
-                Body=bytes,
-                ContentType=content_type,
-            )
 
-        loop = asyncio.get_running_loop()
-        loop.run_in_executor(None, _upload)
+async def open_date(settings: Settings, args: Input, page: Page):
+    # A failed navigation is often a lost session, check it before navigating again
+    await booking_step(
+        settings, "date", lambda: select_date(settings, args, page), lambda: ensure_logged_in(settings, page)
+    )
 
-        log.info("File %s of type %s uploaded successfully.", key, content_type)
-    except Exception as e:
-        log.error(f"Upload failed: {e}")
-        raise e
 
+async def book_slot(settings: Settings, args: Input, page: Page) -> bool:
+    """Book the best slot of the opened date, returns False when none could be selected"""
+    if args.race_concurrency > 1:
+        return await race_slots(settings, args, page)
 
-async def load_bytes_from_s3(key):
-    s3_client = boto3.client("s3")
-    try:
-        response = s3_client.get_object(
-            Bucket=CALENDAR_BUCKET,
-            Key=key,
-        )
-        file_bytes = response["Body"].read()
-        log.info("File %s downloaded successfully.", key)
-        return file_bytes
-    except Exception as e:
-        log.error(f"Download failed: {e}")
-        raise e
-
-
-async def generate_upload_files(future_reservations: list[dict], player: str, placeholder_weeks: int):
-    calendar_key = "calendar/reservations.ics" if player is None else f"calendar/reservations-{player}.ics"
-    reservations_key = "calendar/reservations.json" if player is None else f"calendar/reservations-{player}.json"
-    reservations_placeholders_key = (
-        "calendar/reservations_placeholders.json"
-        if player is None
-        else f"calendar/reservations_placeholders-{player}.json"
+    progress = Progress()
+    success = await booking_step(
+        settings,
+        "slot",
+        lambda: select_slot(settings, args, page, progress),
+        lambda: back_to_matrix(settings, args, page),
     )
 
-    latest_reservation = max(datetime.strptime(reservation["datum"], "%d-%m-%Y") for reservation in future_reservations)
-    placeholders = generate_placeholders(
-        start=max(latest_reservation, datetime.now() + timedelta(days=7)),
-        placeholder_weeks=placeholder_weeks,
-    )
-    reservations = await combine_with_old_reservations(reservations_key, future_reservations, player=player)
+    if not success:
+        return False
+
+    async def confirm() -> bool:
+        if progress.selected is None:
+            # The slot that failed is most likely taken, move on to the next cell nobody tried yet
+            if not await select_slot(settings, args, page, progress):
+                return False
+        # The confirmation step may have been reached by the attempt that failed
+        if not await page.query_selector('input#__make_submit2[type="submit"]'):
+            await confirm_reservation(settings, args, page)
+        return True
+
+    async def next_slot():
+        if await page.query_selector('input#__make_submit2[type="submit"]'):
+            return
+        progress.selected = None
+        await back_to_matrix(settings, args, page)
+
+    if not await booking_step(settings, "confirm", confirm, next_slot):
+        return False
+    # The final submit is never retried, a second click could book a second slot
+    await commit_reservation(settings, args, page)
 
-    json_bytes = str.encode(json.dumps(reservations, indent=4), "utf-8")
-    upload_reservations = upload_bytes_to_s3(reservations_key, json_bytes, content_type="application/json")
+    return True
 
-    json_bytes = str.encode(json.dumps(reservations + placeholders, indent=4), "utf-8")
-    upload_reservations_placeholders = upload_bytes_to_s3(
-        reservations_placeholders_key, json_bytes, content_type="application/json"
-    )
 
-    calendar = await create_calendar(reservations=reservations + placeholders, player=player or "jeroen")
-    upload_calendar = upload_bytes_to_s3(calendar_key, calendar.to_ical(), content_type="text/calendar")
+async def watch_in_browser(settings: Settings, args: Input, page: Page) -> bool:
+    date = target_date(args)
+    url = site_url(settings, PATH_MATRIX.format(date=date.strftime("%Y-%m-%d")))
 
-    await asyncio.gather(
-        upload_reservations,
-        upload_reservations_placeholders,
-        upload_calendar,
-    )
+    async def poll() -> Matrix:
+        # Polls skip the rendering, the matrix is parsed from the html
+        matrix = parse_matrix_html(await (await context_get(page.context, url)).text())
+        if matrix.date is None:
+            log.info("The session expired while watching")
+            await ensure_logged_in(settings, page)
+            matrix = parse_matrix_html(await (await context_get(page.context, url)).text())
+        return matrix
 
+    async def book(matrix: Matrix) -> bool:
+        await open_date(settings, args, page)
+        return await book_slot(settings, args, page)
 
-async def run_calendar_updater(settings: Settings, args: Input, page: Page):
-    await login(settings, page)
-    future_reservations = await get_future_reservations(page)
-
-    await asyncio.gather(
-        *[
-            generate_upload_files(
-                future_reservations=future_reservations,
-                player=player,
-                placeholder_weeks=placeholder_weeks,
-            )
-            for player, placeholder_weeks in (
-                (None, 8),
-                ("jeroen", 8),
-                ("vera", 8),
-            )
-        ]
-    )
+    return await watch_for_cancellations(args, date, ordered_times(args), poll, book)
 
 
-async def main() -> None:
+async def main(timeout: asyncio.Timeout | None = None) -> None:
     """main() is executed when the module is run"""
     settings = Settings()
-    async with Actor as actor, async_playwright() as playwright:
+    async with Actor as actor:
         args = Input(**await actor.get_input() or {})
-        browser = await playwright.chromium.launch(headless=settings.headless)
+
+        if settings.registry:
+            # Imported here, the scheduler builds on the helpers of this module
+            from src.scheduler import run_scheduler
+
+            registry = Registry.parse_file(settings.registry)
+            if timeout is not None:
+                budget = sum(run_budget(job.input, RUN_TIMEOUT) for job in registry.jobs)
+                timeout.reschedule(asyncio.get_running_loop().time() + budget)
+
+            async with async_playwright() as playwright:
+                await run_scheduler(settings=settings, registry=registry, playwright=playwright)
+            return
+
+        if settings.username is None or settings.password is None:
+            raise Exception("Set BR_USERNAME and BR_PASSWORD, or BR_REGISTRY to run the accounts of a registry")
+
+        if settings.standby_port:
+            from src.standby import run_standby
+
+            # Standing by runs until the actor is stopped
+            if timeout is not None:
+                timeout.reschedule(None)
+
+            async with async_playwright() as playwright:
+                await run_standby(settings=settings, playwright=playwright)
+            return
+
+        kind = "calendar" if args.update_calendar else "batch" if args.jobs else "reservation"
+        async with trace_run(kind, engine=args.engine, dry_run=settings.dry_run or args.dry_run):
+            await run(settings, args, timeout)
+
+
+async def run(settings: Settings, args: Input, timeout: asyncio.Timeout | None = None) -> None:
+    if not args.update_calendar:
+        # A pre-armed booking waits for the release, which shouldn't count towards the run timeout
+        if timeout is not None:
+            timeout.reschedule(asyncio.get_running_loop().time() + run_budget(args, RUN_TIMEOUT))
+        await sleep_until_prearm(args)
+
+    # The retries of the steps stay within the timeout of the run
+    with deadline_at(timeout.when() if timeout is not None else None):
+        await run_engine(settings, args)
+
+
+async def run_engine(settings: Settings, args: Input) -> None:
+    if args.engine == "http" and args.jobs:
+        log.info("Batches of jobs are booked in the browser")
+    elif args.engine == "http" and not args.update_calendar:
+        # Imported here since the http engine builds on the helpers of this module
+        from src.http_engine import SubmittedError, run_http_reserver
+
+        try:
+            with span("http_engine"):
+                await run_http_reserver(settings=settings, args=args)
+            return
+        except SubmittedError:
+            # The final submit went out, retrying in the browser could book a second slot
+            raise
+        except WatchExpired:
+            # The whole watch already ran, the browser wouldn't see anything else
+            raise
+        except NoSlotError:
+            # The http engine saw the same matrix, the browser wouldn't find a slot either
+            raise
+        except ValueError:
+            # A date in the past or an unknown opponent, the browser would reject it just the same
+            raise
+        except Exception:
+            log.exception("The http engine failed, falling back to the browser")
+
+    async with async_playwright() as playwright:
+        await run_in_browser(settings=settings, args=args, playwright=playwright)
+
+
+async def run_in_browser(settings: Settings, args: Input, playwright: Playwright) -> None:
+    started = time.monotonic()
+    lean = args.lean_browser and not args.update_calendar
+
+    with span("launch_browser", lean=lean):
+        browser = await playwright.chromium.launch(headless=settings.headless, args=LEAN_LAUNCH_ARGS if lean else None)
+    log.info("Launched the browser in %.0f ms", (time.monotonic() - started) * 1000)
+
+    with span("new_context"):
         device = playwright.devices[DEVICE]
-        context = await browser.new_context(**device)
+        context = await browser.new_context(**device, storage_state=await load_session(settings))
+        context.on("page", report_page_loads)
+        if lean:
+            blocker = await install_request_blocking(context, site_url(settings, PATH_LOGIN), started)
+        if settings.trace_browser:
+            await start_browser_trace(context)
+
         page = await context.new_page()
+    log.info("Browser ready after %.0f ms", (time.monotonic() - started) * 1000)
 
+    failed = True
+    try:
         if args.update_calendar:
+            # Imported here, the calendar dependencies aren't needed on the booking path
+            from src.calendar_updater import run_calendar_updater
+
             await run_calendar_updater(settings=settings, args=args, page=page)
+        elif args.jobs:
+            # Imported here, the batch runner builds on the helpers of this module
+            from src.batch import run_batch
+
+            await run_batch(settings=settings, args=args, page=page)
         else:
             await run_reserver(settings=settings, args=args, page=page)
+        failed = False
+    finally:
+        if settings.trace_browser:
+            tracer = current_tracer()
+            slow = tracer is not None and tracer.active_seconds > settings.trace_threshold_seconds
+            keep = failed or slow
+            try:
+                await stop_browser_trace(context, f"trace-{datetime.now():%Y%m%d-%H%M%S}" if keep else None)
+            except Exception:
+                log.exception("Stopping the browser trace failed")
+
+        if lean:
+            log.info("Blocked %s of %s requests", blocker.blocked, blocker.blocked + blocker.allowed)
 
         await browser.close()
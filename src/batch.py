@@ -0,0 +1,88 @@
+"""
+Batch booking: several booking jobs in one run, over one browser and one logged in session.
+
+Jobs on different dates are independent and run concurrently, each on its own page of the shared context, with at most
+`job_concurrency` dates at a time. Jobs on the same date compete for the same slots, so they run one after the other.
+Every job ends up as a row in the dataset, whether it booked or not.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+
+from apify import Actor
+from playwright.async_api import Page
+
+from src.baanreserveren import ensure_logged_in, reserve
+from src.models import Input, Settings
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class JobResult:
+    date: str
+    opponent: str
+    times: list[str]
+    leden_only: bool
+    status: str
+    seconds: float
+    dry_run: bool
+    error: str | None = None
+
+
+async def run_job(settings: Settings, args: Input, page: Page) -> JobResult:
+    started = time.monotonic()
+    try:
+        await reserve(settings, args, page)
+        status, error = "booked", None
+    except Exception as e:
+        log.exception("Job for %s failed", args.reservation_date)
+        status, error = "failed", str(e) or type(e).__name__
+
+    return JobResult(
+        date=args.reservation_date,
+        opponent=args.opponent,
+        times=args.times,
+        leden_only=args.leden_only,
+        status=status,
+        seconds=round(time.monotonic() - started, 3),
+        dry_run=settings.dry_run or args.dry_run,
+        error=error,
+    )
+
+
+async def run_batch(settings: Settings, args: Input, page: Page) -> list[JobResult]:
+    await ensure_logged_in(settings, page)
+
+    by_date: dict[str, list[Input]] = defaultdict(list)
+    for job in args.jobs:
+        job_args = args.for_job(job)
+        by_date[job_args.reservation_date].append(job_args)
+
+    log.info("Booking %s jobs on %s dates, %s at a time", len(args.jobs), len(by_date), args.job_concurrency)
+    limit = asyncio.Semaphore(args.job_concurrency)
+
+    async def run_date(jobs: list[Input]) -> list[JobResult]:
+        async with limit:
+            date_page = await page.context.new_page()
+            try:
+                results = []
+                for job_args in jobs:
+                    result = await run_job(settings, job_args, date_page)
+                    await Actor.push_data(asdict(result))
+                    results.append(result)
+                return results
+            finally:
+                await date_page.close()
+
+    results = [result for results in await asyncio.gather(*map(run_date, by_date.values())) for result in results]
+
+    failed = [result for result in results if result.status != "booked"]
+    log.info("Booked %s of %s jobs", len(results) - len(failed), len(results))
+    if failed:
+        raise Exception(f"Failed to book {', '.join(result.date for result in failed)}")
+
+    return results
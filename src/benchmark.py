@@ -0,0 +1,221 @@
+"""
+Benchmark the booking engines and the calendar scrape against the local stand-in site.
+
+Every iteration gets a fresh stand-in site seeded with the iteration number, so every mode sees the same matrices. The
+phases of each run (launch, login, select_date, select_slot, place_reservation, book_slot, ...) are timed separately and
+summarised as p50/p95 per mode, next to the end-to-end time. The report is written as json so runs can be compared:
+
+    python -m src.benchmark --modes http http-race playwright --iterations 20 --latency 0.05 --output before.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import time
+from contextlib import AsyncExitStack, contextmanager
+from datetime import datetime, timedelta
+
+from src.baanreserveren import (
+    DEVICE,
+    PATH_LOGIN,
+    login,
+    place_reservation,
+    race_slots,
+    select_date,
+    select_slot,
+    site_url,
+    target_date,
+)
+from src.browser import LEAN_LAUNCH_ARGS, install_request_blocking
+from src.http_engine import create_client, fetch_matrix, http_book_slot, http_login, racer_clients
+from src.mock_site import MockSite
+from src.models import Input, Settings
+
+log = logging.getLogger(__name__)
+
+MODES = ("http", "http-race", "playwright", "playwright-lean", "playwright-race", "calendar")
+RACE_CONCURRENCY = 3
+
+
+@contextmanager
+def timed(timings: dict[str, float], phase: str):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[phase] = time.monotonic() - started
+
+
+async def bench_http(settings: Settings, args: Input, timings: dict[str, float]):
+    async with create_client(settings) as client, AsyncExitStack() as stack:
+        with timed(timings, "login"):
+            await http_login(settings, client)
+            # Every racer logs in with a session of its own
+            racers = await stack.enter_async_context(racer_clients(settings, args, client))
+        with timed(timings, "select_date"):
+            matrix = await fetch_matrix(client, target_date(args))
+
+        # Selecting and placing alternate when a slot gets taken halfway, so they are timed together
+        with timed(timings, "race_slots" if args.race_concurrency > 1 else "book_slot"):
+            if not await http_book_slot(settings, args, client, matrix, racers=racers):
+                raise Exception("Failed to select a slot")
+
+
+async def bench_browser(settings: Settings, args: Input, timings: dict[str, float], playwright, mode: str):
+    lean = mode == "playwright-lean"
+    started = time.monotonic()
+    with timed(timings, "launch"):
+        browser = await playwright.chromium.launch(headless=True, args=LEAN_LAUNCH_ARGS if lean else None)
+        context = await browser.new_context(**playwright.devices[DEVICE])
+        if lean:
+            await install_request_blocking(context, site_url(settings, PATH_LOGIN), started)
+        page = await context.new_page()
+
+    try:
+        with timed(timings, "login"):
+            await login(settings, page)
+
+        if mode == "calendar":
+            from src.calendar_updater import get_future_reservations
+
+            with timed(timings, "get_future_reservations"):
+                await get_future_reservations(settings, page)
+            return
+
+        with timed(timings, "select_date"):
+            await select_date(settings, args, page)
+
+        if args.race_concurrency > 1:
+            with timed(timings, "race_slots"):
+                if not await race_slots(settings, args, page):
+                    raise Exception("Failed to select a slot")
+            return
+
+        with timed(timings, "select_slot"):
+            if not await select_slot(settings, args, page):
+                raise Exception("Failed to select a slot")
+        with timed(timings, "place_reservation"):
+            await place_reservation(settings, args, page)
+    finally:
+        await browser.close()
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(values: list[float]) -> dict:
+    if not values:
+        return {}
+    return {
+        "runs": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+async def bench_mode(mode: str, options: argparse.Namespace) -> dict:
+    phases: dict[str, list[float]] = {}
+    end_to_end, errors = [], []
+    playwright_manager = None
+    if mode.startswith("playwright") or mode == "calendar":
+        from playwright.async_api import async_playwright
+
+        playwright_manager = async_playwright()
+        playwright = await playwright_manager.start()
+
+    try:
+        for iteration in range(options.iterations):
+            with MockSite(
+                occupancy=options.occupancy,
+                seed=iteration,
+                latency=options.latency,
+                contention=options.contention,
+                future=options.future,
+            ) as site:
+                settings = Settings(
+                    username="benchmark@example.com",
+                    password="benchmark",
+                    session_cache="off",
+                    base_url=site.base_url,
+                    dry_run=False,
+                )
+                args = Input(
+                    dry_run=False,
+                    reservation_date=(datetime.today() + timedelta(days=7)).strftime("%Y-%m-%d"),
+                    race_concurrency=RACE_CONCURRENCY if mode.endswith("-race") else 1,
+                )
+
+                timings: dict[str, float] = {}
+                started = time.monotonic()
+                try:
+                    if mode.startswith("http"):
+                        await bench_http(settings, args, timings)
+                    else:
+                        await bench_browser(settings, args, timings, playwright, mode)
+                    end_to_end.append(time.monotonic() - started)
+                except Exception as e:
+                    log.warning("%s run %s failed: %s", mode, iteration, e)
+                    errors.append(str(e) or type(e).__name__)
+
+                for phase, seconds in timings.items():
+                    phases.setdefault(phase, []).append(seconds)
+    finally:
+        if playwright_manager is not None:
+            await playwright_manager.__aexit__()
+
+    return {
+        "failures": len(errors),
+        "errors": sorted(set(errors)),
+        "end_to_end": summarize(end_to_end),
+        "phases": {phase: summarize(seconds) for phase, seconds in phases.items()},
+    }
+
+
+async def run_benchmark(options: argparse.Namespace) -> dict:
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "iterations": options.iterations,
+        "site": {
+            "occupancy": options.occupancy,
+            "latency": options.latency,
+            "contention": options.contention,
+            "future": options.future,
+        },
+        "modes": {},
+    }
+    for mode in options.modes:
+        log.info("Benchmarking %s", mode)
+        report["modes"][mode] = await bench_mode(mode, options)
+
+        summary = report["modes"][mode]["end_to_end"]
+        log.info("%s: p50 %s ms, p95 %s ms", mode, summary.get("p50_ms"), summary.get("p95_ms"))
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=["http", "http-race"])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--occupancy", type=float, default=0.5, help="Fraction of the slots that is already taken")
+    parser.add_argument("--latency", type=float, default=0.05, help="Average delay of every response in seconds")
+    parser.add_argument("--contention", type=float, default=0, help="Chance another member grabs a slot per step")
+    parser.add_argument("--future", type=int, default=20, help="Future reservations for the calendar mode")
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the json report")
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("src").setLevel(logging.WARNING)
+    logging.getLogger("src.benchmark").setLevel(logging.INFO)
+
+    benchmark_report = asyncio.run(run_benchmark(cli_args))
+    with open(cli_args.output, "w") as f:
+        f.write(json.dumps(benchmark_report, indent=4))
+    log.info("Wrote the report to %s", cli_args.output)
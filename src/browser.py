@@ -0,0 +1,148 @@
+"""
+Lean browser profile for the booking path.
+
+Chromium is launched with flags that skip background work, and requests for resources the flow doesn't need (images,
+stylesheets, fonts, media and anything not served by the club) are aborted before they leave the browser. Startup and
+page load times are logged so the gain can be measured.
+
+Contexts can also record a Playwright trace, which is only stored when the run needs a closer look, and can get a rate
+limit that covers both their pages and the requests sent with `context_get`.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import weakref
+from urllib.parse import urlparse
+
+from apify import Actor
+from playwright.async_api import APIResponse, BrowserContext, Page, Route
+
+log = logging.getLogger(__name__)
+
+LEAN_LAUNCH_ARGS = [
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-extensions",
+    "--disable-sync",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--no-default-browser-check",
+    "--no-first-run",
+]
+BLOCKED_RESOURCE_TYPES = {"image", "stylesheet", "font", "media", "texttrack", "eventsource", "manifest", "other"}
+# Page requests that count towards the rate limit of a club, the static assets of a page don't
+RATE_LIMITED_RESOURCE_TYPES = {"document", "xhr", "fetch"}
+
+
+class RequestBlocker:
+    def __init__(self, allowed_host: str, started: float):
+        self.allowed_host = allowed_host
+        self.started = started
+        self.allowed = 0
+        self.blocked = 0
+
+    async def handle(self, route: Route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or urlparse(request.url).hostname != self.allowed_host:
+            self.blocked += 1
+            await route.abort()
+            return
+
+        if not self.allowed:
+            log.info("First request after %.0f ms", (time.monotonic() - self.started) * 1000)
+        self.allowed += 1
+        await route.continue_()
+
+
+async def install_request_blocking(context: BrowserContext, base_url: str, started: float) -> RequestBlocker:
+    blocker = RequestBlocker(urlparse(base_url).hostname, started)
+    await context.route("**/*", blocker.handle)
+    return blocker
+
+
+class RateLimiter:
+    """Spaces the requests to a club evenly, at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next = 0.0
+        self.delayed = 0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self.next)
+        self.next = slot + self.interval
+        if slot > now:
+            self.delayed += 1
+            await asyncio.sleep(slot - now)
+
+
+_limiters: weakref.WeakKeyDictionary[BrowserContext, RateLimiter] = weakref.WeakKeyDictionary()
+
+
+async def install_rate_limit(context: BrowserContext, base_url: str, limiter: RateLimiter):
+    host = urlparse(base_url).hostname
+    _limiters[context] = limiter
+
+    async def handle(route: Route):
+        request = route.request
+        if request.resource_type in RATE_LIMITED_RESOURCE_TYPES and urlparse(request.url).hostname == host:
+            await limiter.acquire()
+        # Hand the request on to the routes registered before, e.g. the request blocking of the lean browser
+        await route.fallback()
+
+    await context.route("**/*", handle)
+
+
+async def context_get(context: BrowserContext, url: str) -> APIResponse:
+    """GET with the cookies of the context, within its rate limit if it has one. Routes don't see these requests"""
+    limiter = _limiters.get(context)
+    if limiter is not None:
+        await limiter.acquire()
+    return await context.request.get(url)
+
+
+def report_page_loads(page: Page):
+    async def on_load(page: Page):
+        try:
+            timing = await page.evaluate(
+                "() => { const [n] = performance.getEntriesByType('navigation'); "
+                "return n ? {url: n.name, duration: n.duration, dom: n.domContentLoadedEventEnd} : null; }"
+            )
+        except Exception:
+            # The page navigated on before we could read its timing
+            return
+
+        if timing:
+            log.info(
+                "Loaded %s in %.0f ms (dom ready after %.0f ms)",
+                urlparse(timing["url"]).path,
+                timing["duration"],
+                timing["dom"],
+            )
+
+    page.on("load", on_load)
+
+
+async def start_browser_trace(context: BrowserContext):
+    # DOM snapshots are enough to replay the run, screenshots would slow the booking down
+    await context.tracing.start(snapshots=True, screenshots=False)
+
+
+async def stop_browser_trace(context: BrowserContext, key: str | None):
+    """Stop recording, and store the trace in the key-value store under `key` unless it is None"""
+    if key is None:
+        await context.tracing.stop()
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace.zip")
+        await context.tracing.stop(path=path)
+        with open(path, "rb") as f:
+            await Actor.set_value(key, f.read(), content_type="application/zip")
+    log.info("Stored the browser trace as %s, open it with `playwright show-trace`", key)
@@ -0,0 +1,426 @@
+"""
+This module updates the calendar feeds: it scrapes the future reservations, merges them with the stored history and
+publishes the reservations and the ical feeds of every player view to S3.
+
+The feeds share most of their events, so an event is rendered once per content and every feed is written by
+concatenating the rendered events between a header that is only built once.
+
+It is only imported for calendar runs, so the booking path doesn't pay for importing its dependencies.
+"""
+
+import asyncio
+import functools
+import gzip
+import io
+import json
+import logging
+import re
+from datetime import date, datetime, timedelta
+
+import pytz
+from icalendar import Calendar, Event, Timezone, TimezoneDaylight, TimezoneStandard, vCalAddress, vRecur, vText
+from playwright.async_api import Page
+
+from src.baanreserveren import PATH_RESERVATIONS, ensure_logged_in, site_url
+from src.browser import context_get
+from src.manifest import Manifest, content_hash, manifest_key
+from src.models import CalendarView, Input, Settings
+from src.storage import is_missing, load_bytes_from_s3, upload_bytes_to_s3
+from src.store import ReservationStore, reservation_key
+from src.tracing import traced
+from src.utils import extract_texts, to_snake_case
+
+log = logging.getLogger(__name__)
+
+FUTURE_RESERVATIONS_SCRIPT = """
+() => {
+    const title = [...document.querySelectorAll("th")].find(th => th.textContent.includes("Reserveringen"));
+    const body = title ? title.closest("tbody") : null;
+    if (!body) return {headers: [], rows: []};
+    const header = body.querySelector("tr.tblTitle");
+    return {
+        headers: header ? [...header.querySelectorAll("td")].map(td => td.innerText) : [],
+        rows: [...body.querySelectorAll("tr.odd, tr.even")].map(tr => ({
+            cells: [...tr.querySelectorAll("td")].map(td => td.innerText),
+            href: tr.querySelector("a") ? tr.querySelector("a").href : null,
+        })),
+    };
+}
+"""
+# How many reservation detail pages are fetched at the same time
+DETAIL_CONCURRENCY = 5
+# Subscribers may reuse a feed for a while, after that they revalidate it with its ETag
+FEED_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+# The feeds are gzip encoded, the data files keep their plain format for the other readers of them. Recorded in the
+# manifest, so objects published with other headers are uploaded again even if their content is the same
+FEED_HEADERS = {"ContentEncoding": "gzip", "CacheControl": FEED_CACHE_CONTROL}
+# Rendered events kept in memory, enough for the history of all feeds and standby runs
+EVENT_CACHE_SIZE = 4096
+CALENDAR_FOOTER = b"END:VCALENDAR\r\n"
+# The uid property of a serialized event, long lines are folded with a continuation that starts with a space
+UID_LINE = re.compile(rb"\r\n(UID:(?:[^\r]|\r\n )*\r\n)")
+# Weekdays as written in recurrence rules, in the order of `datetime.weekday()`
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+
+@traced()
+async def get_future_reservations(
+    settings: Settings, page: Page, known: dict[str, list[str]] | None = None
+) -> list[dict]:
+    """Scrape the future reservations, only fetching the players of reservations that aren't `known` yet"""
+    await page.goto(site_url(settings, PATH_RESERVATIONS))
+
+    # Read the whole table in one go, the players are on the detail page of each reservation
+    table = await page.evaluate(FUTURE_RESERVATIONS_SCRIPT)
+    headers = [to_snake_case(header) for header in table["headers"]]
+    log.info("Found %s reservations", len(table["rows"]))
+
+    known = known or {}
+    semaphore = asyncio.Semaphore(DETAIL_CONCURRENCY)
+
+    async def read_reservation(row: dict) -> dict:
+        reservation = {header: value.strip() for header, value in zip(headers, row["cells"])}
+
+        if reservation_key(reservation) in known:
+            reservation["spelers"] = known[reservation_key(reservation)]
+        elif row["href"]:
+            async with semaphore:
+                response = await context_get(page.context, row["href"])
+                reservation["spelers"] = extract_texts(await response.text(), "div", "res-info-player-name")
+
+        return reservation
+
+    reservations = await asyncio.gather(*[read_reservation(row) for row in table["rows"]])
+    log.info(
+        "Fetched the players of %s reservations, %s were already known",
+        sum(reservation_key(reservation) not in known for reservation in reservations),
+        sum(reservation_key(reservation) in known for reservation in reservations),
+    )
+
+    return list(reservations)
+
+
+@functools.cache
+def calendar_header() -> bytes:
+    """The calendar properties and the Europe/Amsterdam VTIMEZONE, shared by all feeds and built once"""
+    # Create a calendar
+    cal = Calendar()
+
+    # Add some properties to the calendar
+    cal.add("prodid", "-//Jeroen Squash Utrecht//mxm.dk//")
+    cal.add("version", "2.0")
+    cal.add("x-wr-calname", "Squash Reserveringen")
+
+    # Create a VTIMEZONE component for Europe/Amsterdam
+    tz = Timezone()
+    tz.add("tzid", "Europe/Amsterdam")
+    tz.add("x-lic-location", "Europe/Amsterdam")
+
+    # Standard Time Component (assuming standard time here, adjust as necessary)
+    std = TimezoneStandard()
+    std.add("dtstart", datetime(1970, 10, 25, 3, 0, 0))
+    std.add("tzoffsetfrom", timedelta(hours=2))
+    std.add("tzoffsetto", timedelta(hours=1))
+    std.add("tzname", "CET")
+    tz.add_component(std)
+
+    # Daylight Saving Time Component (if applicable, adjust as necessary)
+    dst = TimezoneDaylight()
+    dst.add("dtstart", datetime(1970, 3, 29, 2, 0, 0))
+    dst.add("tzoffsetfrom", timedelta(hours=1))
+    dst.add("tzoffsetto", timedelta(hours=2))
+    dst.add("tzname", "CEST")
+    tz.add_component(dst)
+
+    # Add the VTIMEZONE component to your calendar before adding events
+    cal.add_component(tz)
+
+    # The events go between the header and the end of the calendar
+    return cal.to_ical().removesuffix(CALENDAR_FOOTER)
+
+
+@functools.lru_cache(maxsize=EVENT_CACHE_SIZE)
+def render_event(reservation_json: str, url: str) -> tuple[str, bytes]:
+    """The uid and the serialized VEVENT of a reservation, without dtstamp and sequence, cached by its content"""
+    reservation = json.loads(reservation_json)
+    amsterdam_tz = pytz.timezone("Europe/Amsterdam")
+    event = Event()
+
+    # Parse date and time
+    date_str = reservation["datum"] + " " + reservation["begintijd"]
+    start_datetime = amsterdam_tz.localize(datetime.strptime(date_str, "%d-%m-%Y %H:%M"))
+    # Assuming the duration of each reservation is 1 hour
+    end_datetime = start_datetime + timedelta(minutes=45)
+
+    # Format summary
+    summary = f"{reservation['baan']} 🏆⚫️"
+
+    # Set event properties
+    event.add("summary", summary)
+    event.add("dtstart", start_datetime)
+    event.add("dtend", end_datetime)
+    event.add("location", "Squash Utrecht, Taagdreef 130, 3561 VL Utrecht")
+    event.add("url", url)
+
+    if "spelers" in reservation:
+        event.add("description", "Spelers: " + ", ".join(reservation["spelers"]))
+        for speler in reservation["spelers"]:
+            # Adding attendees
+            attendee = vCalAddress("MAILTO:jeroenbosleusden@mail.com")
+            attendee.params["cn"] = vText(speler)
+            attendee.params["ROLE"] = vText("REQ-PARTICIPANT")
+            event.add("attendee", attendee, encode=0)
+
+    if "rrule" in reservation:
+        # A recurring placeholder, its days with a real reservation are left out
+        event.add("rrule", vRecur.from_ical(reservation["rrule"]))
+        if reservation["exdate"]:
+            event.add(
+                "exdate",
+                [
+                    amsterdam_tz.localize(datetime.strptime(f"{day} {reservation['begintijd']}", "%d-%m-%Y %H:%M"))
+                    for day in reservation["exdate"]
+                ],
+            )
+
+    # Generate a UID for each event, for example using the start datetime and court number
+    uid = f"squash-{reservation['datum'].replace('-', '')}-{reservation['begintijd'].replace(':', '')}-{reservation['baan'].replace(' ', '')}@example.com"
+    if "rrule" in reservation:
+        # The first day of a placeholder moves every week, the rule it stands for doesn't
+        uid = f"squash-placeholder-{reservation['weekdag'].lower()}-{reservation['begintijd'].replace(':', '')}@example.com"
+    event.add("uid", uid)
+
+    # Setting status and transparency
+    event.add("status", "CONFIRMED")
+    event.add("transp", "OPAQUE")
+
+    return uid, event.to_ical()
+
+
+def stamp_event(event: bytes, dtstamp: datetime, sequence: int) -> bytes:
+    """Add the dtstamp and the sequence to a serialized VEVENT, where icalendar would have put them"""
+    stamps = Event()
+    # Add the current timestamp as dtstamp
+    stamps.add("dtstamp", dtstamp)
+    # Increment number to invalidate old values
+    stamps.add("sequence", sequence)
+    dtstamp_line, sequence_line = stamps.to_ical().split(b"\r\n")[1:3]
+
+    # In the canonical order dtstamp directly precedes the uid and the sequence directly follows it
+    start, end = UID_LINE.search(event).span(1)
+    return b"".join((event[:start], dtstamp_line, b"\r\n", event[start:end], sequence_line, b"\r\n", event[end:]))
+
+
+@traced()
+async def create_calendar(
+    settings: Settings,
+    reservations: list[dict],
+    member: str | None = None,
+    manifest: Manifest | None = None,
+    feed: str = None,
+) -> bytes:
+    """The ical feed of the reservations, assembled from the cached header and the cached events"""
+    # The events link to the reservations page of the member, or to the own one when the member isn't known
+    if member in settings.opponents:
+        url = site_url(settings, f"/user/{settings.opponents[member]}/future")
+    else:
+        url = site_url(settings, PATH_RESERVATIONS)
+    hits = render_event.cache_info().hits
+    feed_file = io.BytesIO()
+    feed_file.write(calendar_header())
+    uids = set()
+
+    for reservation in reservations:
+        uid, event = render_event(json.dumps(reservation, sort_keys=True, ensure_ascii=False), url)
+
+        if manifest is not None:
+            # Only move dtstamp and sequence when the event changed, so unchanged feeds render to the same bytes
+            dtstamp, sequence = manifest.event_stamp(feed, uid, event.decode("utf-8"))
+            uids.add(uid)
+        else:
+            dtstamp, sequence = datetime.now(), int(datetime.now().strftime("%Y%m%d"))
+
+        feed_file.write(stamp_event(event, dtstamp, sequence))
+
+    feed_file.write(CALENDAR_FOOTER)
+    log.info(
+        "Added %s events to calendar %s, %s of them rendered before",
+        len(reservations),
+        feed,
+        render_event.cache_info().hits - hits,
+    )
+
+    if manifest is not None:
+        manifest.prune_events(feed, uids)
+
+    return feed_file.getvalue()
+
+
+def generate_placeholders(
+    start: datetime, placeholder_weeks: int, pattern: list[str], booked: set[date] | None = None
+) -> list[dict]:
+    """One recurring placeholder per weekday and time of the pattern, skipping the days that are already booked"""
+    amsterdam_tz = pytz.timezone("Europe/Amsterdam")
+    booked = booked or set()
+    placeholders = []
+
+    for entry in pattern:
+        weekday, begintijd = entry.split()
+        hour, minute = map(int, begintijd.split(":"))
+        if weekday not in WEEKDAYS:
+            raise ValueError(f"Unknown weekday {weekday} in placeholder pattern, use one of {', '.join(WEEKDAYS)}")
+
+        first = start + timedelta(days=(WEEKDAYS.index(weekday) - start.weekday()) % 7)
+        first = datetime(first.year, first.month, first.day, hour, minute)
+        occurrences = [first + timedelta(weeks=week) for week in range(placeholder_weeks)]
+        if not occurrences:
+            continue
+        until = amsterdam_tz.localize(occurrences[-1]).astimezone(pytz.utc)
+
+        placeholders.append(
+            {
+                "datum": first.strftime("%d-%m-%Y"),
+                "weekdag": first.strftime("%A"),
+                "begintijd": begintijd,
+                "baan": "🚧 Placeholder",
+                "spelers": ["Jeroen Bos", "Vera Sweere"],
+                "rrule": f"FREQ=WEEKLY;BYDAY={weekday};UNTIL={until:%Y%m%dT%H%M%SZ}",
+                "exdate": [day.strftime("%d-%m-%Y") for day in occurrences if day.date() in booked],
+            }
+        )
+
+    return placeholders
+
+
+async def upload_if_changed(settings: Settings, manifest: Manifest, key, bytes, content_type, feed: bool = False):
+    headers = FEED_HEADERS if feed else None
+    if manifest.is_unchanged(key, bytes, headers):
+        log.info("File %s is unchanged, skipping the upload", key)
+        manifest.record_skip(key, bytes)
+        return
+
+    # Same content gives the same compressed bytes, and so the same ETag for the conditional requests of subscribers
+    body = gzip.compress(bytes, mtime=0) if feed else bytes
+    await upload_bytes_to_s3(
+        key,
+        body,
+        content_type=content_type,
+        bucket=settings.calendar_bucket,
+        Metadata={"sha256": content_hash(bytes)},
+        **(headers or {}),
+    )
+    manifest.record_upload(key, bytes, headers)
+
+
+@traced()
+async def load_manifest(settings: Settings) -> Manifest:
+    try:
+        return Manifest.from_bytes(
+            await load_bytes_from_s3(manifest_key(settings.calendar_prefix), bucket=settings.calendar_bucket)
+        )
+    except Exception as e:
+        # Starting over on any other error would reset the sequences of the events and overwrite the manifest
+        if not is_missing(e):
+            raise
+        log.warning("No upload manifest found, uploading every file")
+        return Manifest()
+
+
+@traced()
+async def generate_upload_files(
+    settings: Settings,
+    store: ReservationStore,
+    view: CalendarView,
+    manifest: Manifest,
+    pattern: list[str],
+    window_days: int = 0,
+):
+    prefix, suffix = settings.calendar_prefix, "" if view.player is None else f"-{view.player}"
+    calendar_key = f"{prefix}/reservations{suffix}.ics"
+    reservations_key = f"{prefix}/reservations{suffix}.json"
+    reservations_placeholders_key = f"{prefix}/reservations_placeholders{suffix}.json"
+    member = view.member or view.player
+
+    reservations, dates = store.view(view.player), store.dates_of(view.player)
+    # Everything up to a week ahead can be booked already, placeholders cover the weeks after
+    placeholders = generate_placeholders(
+        start=datetime.now() + timedelta(days=7),
+        placeholder_weeks=view.placeholder_weeks,
+        pattern=pattern,
+        booked=set(dates),
+    )
+
+    json_bytes = str.encode(json.dumps(reservations, indent=4, sort_keys=True), "utf-8")
+    upload_reservations = upload_if_changed(
+        settings, manifest, reservations_key, json_bytes, content_type="application/json"
+    )
+
+    json_bytes = str.encode(json.dumps(reservations + placeholders, indent=4, sort_keys=True), "utf-8")
+    upload_reservations_placeholders = upload_if_changed(
+        settings, manifest, reservations_placeholders_key, json_bytes, content_type="application/json"
+    )
+
+    calendar = await create_calendar(
+        settings,
+        reservations=reservations + placeholders,
+        member=member,
+        manifest=manifest,
+        feed=calendar_key,
+    )
+    upload_calendar = upload_if_changed(
+        settings, manifest, calendar_key, calendar, content_type="text/calendar; charset=utf-8", feed=True
+    )
+    uploads = [upload_reservations, upload_reservations_placeholders, upload_calendar]
+
+    if window_days:
+        # The rolling window feed stays the same size however long the history gets
+        since = datetime.now().date() - timedelta(days=window_days)
+        window_key = calendar_key.replace(".ics", "-recent.ics")
+        window_calendar = await create_calendar(
+            settings,
+            reservations=[reservation for reservation, day in zip(reservations, dates) if day >= since] + placeholders,
+            member=member,
+            manifest=manifest,
+            feed=window_key,
+        )
+        uploads.append(
+            upload_if_changed(
+                settings, manifest, window_key, window_calendar, content_type="text/calendar; charset=utf-8", feed=True
+            )
+        )
+
+    await asyncio.gather(*uploads)
+
+
+async def run_calendar_updater(settings: Settings, args: Input, page: Page):
+    await ensure_logged_in(settings, page)
+
+    # The history is loaded once, every player view is derived from it in memory
+    store, manifest = await asyncio.gather(
+        ReservationStore.load(settings.calendar_bucket, settings.calendar_prefix), load_manifest(settings)
+    )
+    store.set_future(await get_future_reservations(settings, page, known=store.known_players()))
+
+    await asyncio.gather(
+        store.save(settings.calendar_bucket, settings.calendar_prefix),
+        *[
+            generate_upload_files(
+                settings,
+                store=store,
+                view=view,
+                manifest=manifest,
+                pattern=args.placeholder_pattern,
+                window_days=args.feed_window_days,
+            )
+            for view in settings.calendar_views
+        ],
+    )
+
+    if manifest.changed:
+        await upload_bytes_to_s3(
+            manifest_key(settings.calendar_prefix),
+            manifest.to_bytes(),
+            content_type="application/json",
+            bucket=settings.calendar_bucket,
+        )
+    manifest.log_summary()
@@ -0,0 +1,457 @@
+"""
+Reservation engine that books a slot with plain http form posts instead of driving a browser.
+
+It walks the same steps as the Playwright flow in `baanreserveren.py` (login, open the day matrix, pick a free
+slot, `__make_submit` and `__make_submit2`), but skips the Chromium cold start entirely.
+"""
+
+import asyncio
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import AsyncIterator
+from urllib.parse import urljoin
+
+import httpx
+
+from src.baanreserveren import (
+    PATH_LOGIN,
+    PATH_MAKE,
+    PATH_MATRIX,
+    URL_BASE,
+    NoSlotError,
+    check_opponent,
+    ordered_times,
+    target_date,
+)
+from src.matrix import Cell, Matrix, is_excluded, log_ranking, parse_matrix_html, rank_cells, to_candidates
+from src.models import Input, Settings
+from src.racing import Candidate, Race, run_race
+from src.release import release_instant, wait_for_release
+from src.session import cookies_to_state, load_session, save_session, state_to_cookies
+from src.tracing import traced
+from src.watcher import WatchExpired, watch_for_cancellations
+
+log = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = 10
+# Matrix states of cells that can be booked once the slots of the day are released
+RELEASABLE_STATES = ("free", "closed")
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36"
+)
+
+
+class SubmittedError(Exception):
+    """Raised when something fails after the final submit was sent, so the reservation may already exist"""
+
+
+class SlotTakenError(Exception):
+    """Raised when the slot was taken by someone else between opening and confirming it"""
+
+
+def is_taken(response: httpx.Response) -> bool:
+    return response.status_code == 409 or "niet meer beschikbaar" in response.text
+
+
+@dataclass
+class Form:
+    action: str
+    method: str = "post"
+    id: str | None = None
+    fields: dict[str, str] = field(default_factory=dict)
+    types: dict[str, str] = field(default_factory=dict)
+    submits: dict[str, tuple[str, str]] = field(default_factory=dict)
+
+    def payload(self, submit: str | None = None, **overrides: str) -> dict[str, str]:
+        data = {**self.fields, **overrides}
+        if submit is not None:
+            name, value = self.submits[submit]
+            data[name] = value
+        return data
+
+
+@dataclass
+class MakeForm:
+    url: str
+    court: str
+    form: Form
+
+
+class _PageParser(HTMLParser):
+    """Collects the forms and the `Baan` row of a baanreserveren page"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms: list[Form] = []
+        self.court: str | None = None
+
+        self._form: Form | None = None
+        self._select: str | None = None
+        self._text = ""
+        self._row_cells: list[str] = []
+        self._in_cell = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or "" for key, value in attrs}
+
+        if tag == "form":
+            self._form = Form(
+                action=attrs.get("action", ""), method=attrs.get("method", "get").lower(), id=attrs.get("id")
+            )
+            self.forms.append(self._form)
+        elif tag in ("input", "button") and self._form is not None:
+            name = attrs.get("name")
+            input_type = attrs.get("type", "submit" if tag == "button" else "text").lower()
+            if input_type == "submit":
+                key = attrs.get("id") or name or f"submit-{len(self._form.submits)}"
+                if name:
+                    self._form.submits[key] = (name, attrs.get("value", ""))
+            elif name and (input_type not in ("checkbox", "radio") or "checked" in attrs):
+                self._form.fields[name] = attrs.get("value", "")
+                self._form.types[name] = input_type
+        elif tag == "select" and self._form is not None:
+            self._select = attrs.get("name")
+        elif tag == "option" and self._form is not None and self._select:
+            if self._select not in self._form.fields or "selected" in attrs:
+                self._form.fields[self._select] = attrs.get("value", "")
+        elif tag == "tr":
+            self._row_cells = []
+        elif tag == "td":
+            self._in_cell = True
+            self._text = ""
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "select":
+            self._select = None
+        elif tag == "td" and self._in_cell:
+            self._in_cell = False
+            self._row_cells.append(self._text.strip())
+            if len(self._row_cells) == 2 and self._row_cells[0] == "Baan" and self.court is None:
+                self.court = self._row_cells[1]
+
+    def handle_data(self, data):
+        if self._in_cell:
+            self._text += data
+
+
+def parse_page(html: str) -> _PageParser:
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+    return parser
+
+
+def find_form(parser: _PageParser, submit: str | None = None, form_id: str | None = None) -> Form | None:
+    for form in parser.forms:
+        if form_id is not None and form.id == form_id:
+            return form
+        if submit is not None and submit in form.submits:
+            return form
+
+    return None
+
+
+def is_logged_in(html: str) -> bool:
+    return 'href="/auth/logout"' in html
+
+
+def create_client(settings: Settings) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=settings.base_url or URL_BASE,
+        follow_redirects=True,
+        timeout=HTTP_TIMEOUT,
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+@traced()
+async def http_login(settings: Settings, client: httpx.AsyncClient):
+    response = await client.get(PATH_LOGIN)
+    response.raise_for_status()
+
+    form = find_form(parse_page(response.text), form_id="login-form")
+    if form is None:
+        raise Exception("Login form not found")
+
+    # Same fields as the browser fills: '#login-form input[type="email"]' and '#login-form input[type="password"]'
+    inputs = {input_type: name for name, input_type in form.types.items()}
+    if "email" not in inputs or "password" not in inputs:
+        raise Exception("Login form has an unexpected layout")
+
+    data = form.payload(**{inputs["email"]: settings.username, inputs["password"]: settings.password})
+    response = await client.post(urljoin(str(response.url), form.action), data=data)
+    response.raise_for_status()
+
+    if not is_logged_in(response.text):
+        raise Exception("Login failed")
+
+    log.info("Succesfully logged in")
+
+
+@traced()
+async def http_ensure_logged_in(settings: Settings, client: httpx.AsyncClient, slot: int = 0):
+    """Reuse the cached session when it is still logged in, log in otherwise"""
+    state = await load_session(settings, slot)
+    if state:
+        state_to_cookies(state, client.cookies)
+        response = await client.get(PATH_LOGIN)
+        if is_logged_in(response.text):
+            log.info("Reusing the cached session")
+            return
+
+        log.info("Cached session expired, logging in again")
+        client.cookies.clear()
+
+    await http_login(settings, client)
+    await save_session(settings, cookies_to_state(client.cookies), slot)
+
+
+@asynccontextmanager
+async def racer_clients(
+    settings: Settings, args: Input, client: httpx.AsyncClient
+) -> AsyncIterator[list[httpx.AsyncClient]]:
+    """`client` and a logged in client for every further racer, so no two racers share a session of the site"""
+    async with AsyncExitStack() as stack:
+        others = [await stack.enter_async_context(create_client(settings)) for _ in range(1, args.race_concurrency)]
+        await asyncio.gather(
+            *[http_ensure_logged_in(settings, other, slot) for slot, other in enumerate(others, start=1)]
+        )
+        yield [client, *others]
+
+
+@traced()
+async def fetch_matrix(client: httpx.AsyncClient, date: datetime) -> Matrix:
+    response = await client.get(PATH_MATRIX.format(date=date.strftime("%Y-%m-%d")))
+    response.raise_for_status()
+
+    matrix = parse_matrix_html(response.text)
+    if matrix.date is None:
+        raise Exception("Matrix not found, is the session still valid?")
+
+    if matrix.date.date() != date.date():
+        raise Exception(f"Matrix opened on {matrix.date:%Y-%m-%d} instead of {date:%Y-%m-%d}")
+
+    log.info("Fetched the matrix of %s with %s cells", matrix.date.strftime("%Y-%m-%d"), len(matrix.cells))
+    return matrix
+
+
+@traced()
+async def open_make_form(client: httpx.AsyncClient, cell: Cell) -> MakeForm | None:
+    url = PATH_MAKE.format(resource=cell.resource, slot=cell.slot)
+    response = await client.get(url)
+    response.raise_for_status()
+
+    page = parse_page(response.text)
+    form = find_form(page, submit="__make_submit")
+    if form is None:
+        log.info("Slot at %s is not available (anymore)", cell.time)
+        return None
+
+    return MakeForm(url=str(response.url), court=page.court or "", form=form)
+
+
+@traced()
+async def http_select_slot(
+    settings: Settings,
+    args: Input,
+    client: httpx.AsyncClient,
+    matrix: Matrix,
+    states=("free",),
+    tried: set[Cell] | None = None,
+):
+    """Open the best slot of the matrix that isn't in `tried`, adding every slot it opens to `tried`"""
+    tried = set() if tried is None else tried
+    ranked = rank_cells(matrix, args, ordered_times(args), states=states)
+    log_ranking(ranked)
+
+    for ranked_cell in ranked:
+        if ranked_cell.cell in tried:
+            continue
+        tried.add(ranked_cell.cell)
+
+        make_form = await open_make_form(client, ranked_cell.cell)
+
+        if make_form is None:
+            continue
+        elif is_excluded(make_form.court, args):
+            # The matrix header didn't tell, but the reservation form shows an excluded court
+            log.info("Skipping %s at %s", make_form.court.strip(), ranked_cell.cell.time)
+        else:
+            log.info("Selected %s", ranked_cell.describe())
+            return make_form
+
+    return None
+
+
+@traced()
+async def http_confirm_reservation(
+    settings: Settings, args: Input, client: httpx.AsyncClient, make_form: MakeForm
+) -> MakeForm:
+    data = make_form.form.payload(submit="__make_submit", **{"players[2]": settings.opponents[args.opponent]})
+    response = await client.post(urljoin(make_form.url, make_form.form.action), data=data)
+    if is_taken(response):
+        raise SlotTakenError(f"{make_form.court.strip()} was taken before it could be confirmed")
+    response.raise_for_status()
+
+    confirm_form = find_form(parse_page(response.text), submit="__make_submit2")
+    if confirm_form is None:
+        raise Exception("Confirmation step not reached")
+
+    return MakeForm(url=str(response.url), court=make_form.court, form=confirm_form)
+
+
+@traced()
+async def http_commit_reservation(settings: Settings, args: Input, client: httpx.AsyncClient, confirm: MakeForm):
+    if not settings.dry_run and not args.dry_run:
+        try:
+            response = await client.post(
+                urljoin(confirm.url, confirm.form.action), data=confirm.form.payload(submit="__make_submit2")
+            )
+            if not is_taken(response):
+                response.raise_for_status()
+        except Exception as e:
+            raise SubmittedError(f"Final submit failed: {e}") from e
+
+        if is_taken(response):
+            # The site refused the slot, so nothing was booked
+            raise SlotTakenError(f"{confirm.court.strip()} was taken before the final submit")
+
+        if find_form(parse_page(response.text), submit="__make_submit2") is not None:
+            raise SubmittedError("Reservation was not confirmed")
+
+        log.info("Succesfully placed the reservation with %s", args.opponent)
+    else:
+        log.info("[DRY RUN] Not actually placing the reservation")
+
+
+async def http_place_reservation(settings: Settings, args: Input, client: httpx.AsyncClient, make_form: MakeForm):
+    confirm = await http_confirm_reservation(settings, args, client, make_form)
+    await http_commit_reservation(settings, args, client, confirm)
+
+    return True
+
+
+@traced()
+async def http_race_slots(
+    settings: Settings, args: Input, clients: list[httpx.AsyncClient], matrix: Matrix, states=("free",)
+) -> bool:
+    """Race the candidate slots as parallel form posts, each attempt over a logged in client of its own"""
+    idle: asyncio.Queue[httpx.AsyncClient] = asyncio.Queue()
+    for client in clients:
+        idle.put_nowait(client)
+
+    async def attempt(candidate: Candidate, race: Race) -> bool:
+        # The form state of a slot lives in the session, so an attempt has its session to itself
+        client = await idle.get()
+        try:
+            return await attempt_with(client, candidate, race)
+        finally:
+            idle.put_nowait(client)
+
+    async def attempt_with(client: httpx.AsyncClient, candidate: Candidate, race: Race) -> bool:
+        make_form = await open_make_form(client, candidate.slot)
+        if make_form is None:
+            race.mark(candidate, "not available")
+            return False
+        if is_excluded(make_form.court, args):
+            race.mark(candidate, f"skipped {make_form.court.strip()}")
+            return False
+        race.mark(candidate, f"opened {make_form.court.strip()}")
+
+        confirm = await http_confirm_reservation(settings, args, client, make_form)
+        race.mark(candidate, "confirmation step")
+
+        if not race.claim(candidate):
+            return False
+
+        await http_commit_reservation(settings, args, client, confirm)
+        race.mark(candidate, "committed")
+        return True
+
+    ranked = rank_cells(matrix, args, ordered_times(args), states=states)
+    log_ranking(ranked)
+    candidates = to_candidates(ranked)
+    if not candidates:
+        log.info("No slots available at %s", ", ".join(ordered_times(args)))
+        return False
+
+    return await run_race(candidates, attempt, concurrency=len(clients)) is not None
+
+
+async def run_http_reserver(settings: Settings, args: Input):
+    check_opponent(settings, args)
+    async with create_client(settings) as client:
+        await http_ensure_logged_in(settings, client)
+        date = target_date(args)
+        matrix = await fetch_matrix(client, date)
+        # The other racers log in before the release too, off the critical path
+        async with racer_clients(settings, args, client) as clients:
+            states = ("free",)
+            release = release_instant(args)
+            if release is not None:
+                # Refreshing the matrix keeps the session alive and the candidates current
+                async def keep_warm():
+                    nonlocal matrix
+                    matrix = await fetch_matrix(client, date)
+
+                await wait_for_release(release, keep_warm=keep_warm, keep_warm_seconds=args.keep_warm_seconds)
+                states = RELEASABLE_STATES
+
+            if not await http_book_slot(settings, args, client, matrix, states=states, racers=clients):
+                if not args.watch_minutes:
+                    raise NoSlotError("Failed to select a slot")
+
+                async def poll() -> Matrix:
+                    try:
+                        return await fetch_matrix(client, date)
+                    except httpx.HTTPError:
+                        raise
+                    except Exception:
+                        log.info("The session expired while watching")
+                        await http_ensure_logged_in(settings, client)
+                        return await fetch_matrix(client, date)
+
+                async def book(matrix: Matrix) -> bool:
+                    return await http_book_slot(settings, args, client, matrix, racers=clients)
+
+                if not await watch_for_cancellations(args, date, ordered_times(args), poll, book):
+                    raise WatchExpired("No slot freed up while watching")
+
+    log.info("Placed reservation successfully")
+
+
+async def http_book_slot(
+    settings: Settings,
+    args: Input,
+    client: httpx.AsyncClient,
+    matrix: Matrix,
+    states=("free",),
+    racers: list[httpx.AsyncClient] | None = None,
+) -> bool:
+    """
+    Book the best slot of the matrix, returns False when none could be selected
+
+    When racing, `racers` are the logged in clients of the racers, see `racer_clients`.
+    """
+    if racers and len(racers) > 1:
+        try:
+            return await http_race_slots(settings, args, racers, matrix, states=states)
+        except SlotTakenError as e:
+            # The race ends with its winner, the other candidates are tried one by one
+            log.info("%s, trying the other slots", e)
+
+    tried: set[Cell] = set()
+    while (make_form := await http_select_slot(settings, args, client, matrix, states, tried)) is not None:
+        try:
+            await http_place_reservation(settings, args, client, make_form)
+            return True
+        except SlotTakenError as e:
+            # Someone else was quicker, the next candidate of the same matrix may still be free
+            log.info("%s, trying the next slot", e)
+
+    return False
@@ -0,0 +1,88 @@
+"""
+Manifest of the published calendar objects, used to skip uploads whose content didn't change.
+
+Next to a content hash per object key it tracks a `dtstamp`/`sequence` pair per event of every feed. Those only move
+when the content of the event changes, so rendering the same reservations twice gives the same bytes.
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+log = logging.getLogger(__name__)
+
+
+def manifest_key(prefix: str) -> str:
+    return f"{prefix}/manifest.json"
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+@dataclass
+class Manifest:
+    objects: dict[str, dict] = field(default_factory=dict)
+    events: dict[str, dict[str, dict]] = field(default_factory=dict)
+
+    bytes_uploaded: int = 0
+    bytes_saved: int = 0
+    uploaded: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> "Manifest":
+        data = json.loads(content.decode("utf-8"))
+        return cls(objects=data.get("objects", {}), events=data.get("events", {}))
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({"objects": self.objects, "events": self.events}, indent=4, sort_keys=True).encode("utf-8")
+
+    def is_unchanged(self, key: str, content: bytes, headers: dict[str, str] | None = None) -> bool:
+        """Whether the object was uploaded with this content and with these headers"""
+        entry = self.objects.get(key, {})
+        return entry.get("sha256") == content_hash(content) and entry.get("headers") == headers
+
+    def record_skip(self, key: str, content: bytes):
+        self.bytes_saved += len(content)
+        self.skipped.append(key)
+
+    def record_upload(self, key: str, content: bytes, headers: dict[str, str] | None = None):
+        self.objects[key] = {"sha256": content_hash(content), "size": len(content), "headers": headers}
+        self.bytes_uploaded += len(content)
+        self.uploaded.append(key)
+
+    def event_stamp(self, feed: str, uid: str, content: str) -> tuple[datetime, int]:
+        """The dtstamp and sequence of an event, bumped only when its content changed since the last run"""
+        events = self.events.setdefault(feed, {})
+        digest = content_hash(content.encode("utf-8"))
+        stamp = events.get(uid)
+
+        if stamp is None:
+            # Feeds used to get the date as sequence on every run, start above that so clients accept the update
+            now = datetime.now(timezone.utc).replace(microsecond=0)
+            stamp = {"sha256": digest, "dtstamp": now.isoformat(), "sequence": int(now.strftime("%Y%m%d"))}
+        elif stamp["sha256"] != digest:
+            now = datetime.now(timezone.utc).replace(microsecond=0)
+            stamp = {"sha256": digest, "dtstamp": now.isoformat(), "sequence": stamp["sequence"] + 1}
+
+        events[uid] = stamp
+        return datetime.fromisoformat(stamp["dtstamp"]), stamp["sequence"]
+
+    def prune_events(self, feed: str, uids: set[str]):
+        self.events[feed] = {uid: stamp for uid, stamp in self.events.get(feed, {}).items() if uid in uids}
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.uploaded)
+
+    def log_summary(self):
+        log.info(
+            "Uploaded %s objects (%s bytes), skipped %s unchanged objects (%s bytes saved)",
+            len(self.uploaded),
+            self.bytes_uploaded,
+            len(self.skipped),
+            self.bytes_saved,
+        )
@@ -0,0 +1,207 @@
+"""
+The day matrix as a compact grid (times x courts x state) and the ranking of its cells.
+
+The grid is read in one go, from the page with `MATRIX_SCRIPT` or from the html with `parse_matrix_html`, and the
+candidates are ranked before anything is clicked: by time preference, then by hall, with excluded courts (Court 1 has
+to be booked via the reception) dropped up front.
+"""
+
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from html.parser import HTMLParser
+
+from src.models import Input
+from src.racing import Candidate
+
+log = logging.getLogger(__name__)
+
+MATRIX_SCRIPT = """
+() => {
+    const title = document.querySelector("#matrix_date_title");
+    const courts = {byResource: {}, byColumn: []};
+    // Only the headers of the matrix itself name the courts, other tables on the page would shift the columns
+    const firstRow = document.querySelector("tr[data-time]");
+    const table = firstRow ? firstRow.closest("table") : null;
+    for (const th of table ? table.querySelectorAll("tr:not([data-time]) th") : []) {
+        const name = th.innerText.trim();
+        if (!name) continue;
+        const resource = (th.className.match(/\\br-(\\d+)\\b/) || [])[1];
+        if (resource) courts.byResource[resource] = name;
+        courts.byColumn.push(name);
+    }
+    return {
+        title: title ? title.textContent.trim() : "",
+        courts: courts,
+        rows: [...document.querySelectorAll("tr[data-time]")].map(tr => ({
+            time: tr.getAttribute("data-time"),
+            cells: [...tr.querySelectorAll("td")].map(td => ({
+                state: td.getAttribute("type"),
+                resource: (td.className.match(/\\br-(\\d+)\\b/) || [])[1] || td.getAttribute("resource"),
+                slot: td.getAttribute("slot"),
+            })),
+        })),
+    };
+}
+"""
+
+
+@dataclass(frozen=True)
+class Cell:
+    time: str
+    column: int
+    court: str
+    state: str | None
+    resource: str | None
+    slot: str | None
+
+
+@dataclass
+class Matrix:
+    date: datetime | None
+    cells: list[Cell]
+
+    @property
+    def courts(self) -> list[str]:
+        return list(dict.fromkeys(cell.court for cell in self.cells))
+
+    def states(self) -> dict[tuple[str, int], str | None]:
+        return {(cell.time, cell.column): cell.state for cell in self.cells}
+
+
+@dataclass(frozen=True)
+class RankedCell:
+    cell: Cell
+    score: tuple
+
+    def describe(self) -> str:
+        return f"{self.cell.time} {self.cell.court or f'column {self.cell.column}'} ({self.cell.state})"
+
+
+def parse_title(title: str) -> datetime | None:
+    if not title:
+        return None
+    return datetime.strptime(title.split(" ")[1], "%d-%m-%Y")
+
+
+def build_matrix(data: dict) -> Matrix:
+    """Build the grid from the output of `MATRIX_SCRIPT`"""
+    by_resource, by_column = data["courts"]["byResource"], data["courts"]["byColumn"]
+    cells = [
+        Cell(
+            time=row["time"],
+            column=column,
+            court=by_resource.get(cell["resource"]) or (by_column[column] if column < len(by_column) else ""),
+            state=cell["state"],
+            resource=cell["resource"],
+            slot=cell["slot"],
+        )
+        for row in data["rows"]
+        for column, cell in enumerate(row["cells"])
+    ]
+    return Matrix(date=parse_title(data["title"]), cells=cells)
+
+
+class _MatrixParser(HTMLParser):
+    """Collects the same data as `MATRIX_SCRIPT` from the html of the matrix page"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.data = {"title": "", "courts": {"byResource": {}, "byColumn": []}, "rows": []}
+        self._capture: str | None = None
+        self._resource: str | None = None
+        self._text = ""
+        self._row: dict | None = None
+        # The courts and the number of rows of every open table, only those of the matrix table are kept
+        self._tables: list[tuple[dict, int]] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value or "" for key, value in attrs}
+        resource = re.search(r"\br-(\d+)\b", attrs.get("class", ""))
+
+        if attrs.get("id") == "matrix_date_title":
+            self._capture, self._text = "title", ""
+        elif tag == "table":
+            self._tables.append(({"byResource": {}, "byColumn": []}, len(self.data["rows"])))
+        elif tag == "tr":
+            self._row = {"time": attrs["data-time"], "cells": []} if "data-time" in attrs else None
+        elif tag == "th" and self._row is None and self._tables:
+            self._capture, self._text, self._resource = "court", "", resource.group(1) if resource else None
+        elif tag == "td" and self._row is not None:
+            self._row["cells"].append(
+                {
+                    "state": attrs.get("type"),
+                    "resource": resource.group(1) if resource else attrs.get("resource"),
+                    "slot": attrs.get("slot"),
+                }
+            )
+
+    def handle_endtag(self, tag):
+        if self._capture == "title" and tag != "br":
+            self.data["title"] = self._text.strip()
+            self._capture = None
+        elif self._capture == "court" and tag == "th":
+            self._capture = None
+            courts = self._tables[-1][0]
+            if name := self._text.strip():
+                if self._resource:
+                    courts["byResource"][self._resource] = name
+                courts["byColumn"].append(name)
+        elif tag == "table" and self._tables:
+            courts, rows = self._tables.pop()
+            if len(self.data["rows"]) > rows and not self.data["courts"]["byColumn"]:
+                self.data["courts"] = courts
+        elif tag == "tr" and self._row is not None:
+            self.data["rows"].append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._capture:
+            self._text += data
+
+
+def parse_matrix_html(html: str) -> Matrix:
+    parser = _MatrixParser()
+    parser.feed(html)
+    parser.close()
+    return build_matrix(parser.data)
+
+
+def is_excluded(court: str, args: Input) -> bool:
+    # Match on the start of the name, the trailing space keeps "court 1 " from matching "Court 10"
+    name = f"{court.strip().lower()} "
+    return any(name.startswith(prefix.lower()) for prefix in args.excluded_courts)
+
+
+def rank_cells(matrix: Matrix, args: Input, times: list[str], states=("free",)) -> list[RankedCell]:
+    """Rank the bookable cells: preferred time first, then the hall in the back for members only"""
+    preference = {time: position for position, time in enumerate(times)}
+    ranked = []
+
+    for cell in matrix.cells:
+        if cell.time not in preference or cell.state not in states:
+            continue
+        if is_excluded(cell.court, args):
+            log.debug("Excluded %s at %s", cell.court, cell.time)
+            continue
+
+        # For members only we want the hall in the back to have preference
+        hall = -cell.column if args.leden_only else cell.column
+        ranked.append(RankedCell(cell=cell, score=(preference[cell.time], hall)))
+
+    ranked.sort(key=lambda ranked_cell: ranked_cell.score)
+    return ranked
+
+
+def log_ranking(ranked: list[RankedCell]):
+    log.info("Ranked %s candidate slots", len(ranked))
+    for position, ranked_cell in enumerate(ranked, start=1):
+        log.info("%3d. %s score=%s", position, ranked_cell.describe(), ranked_cell.score)
+
+
+def to_candidates(ranked: list[RankedCell]) -> list[Candidate]:
+    return [
+        Candidate(time=ranked_cell.cell.time, rank=rank, slot=ranked_cell.cell)
+        for rank, ranked_cell in enumerate(ranked)
+    ]
@@ -0,0 +1,386 @@
+"""
+Local stand-in for the baanreserveren site, serving the pages the actor relies on.
+
+It reproduces the login form, the day matrix, the reservation popup of a slot, the two confirmation steps and the list
+of future reservations with their detail pages, so the engines and the calendar updater can be exercised without
+touching the club. Every response can be delayed to mimic the latency of the club, and other members can be made to
+grab slots while we are booking them. Run it with `python -m src.mock_site` and point the actor at it with
+`BR_BASE_URL=http://127.0.0.1:8080`.
+"""
+
+import argparse
+import logging
+import random
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+log = logging.getLogger(__name__)
+
+COURTS = {
+    "1": "Court 1 Voorhal",
+    "2": "Court 2 Voorhal",
+    "3": "Court 3 Achterhal",
+    "4": "Court 4 Achterhal",
+}
+TIMES = [f"{hour:02d}:{minute:02d}" for hour in range(17, 23) for minute in (0, 15, 30, 45)]
+PLAYERS = {
+    "1148695": "Jeroen Bos",
+    "1409256": "Vera Sweere",
+    "1340920": "Koen",
+}
+WEEKDAYS = ["Maandag", "Dinsdag", "Woensdag", "Donderdag", "Vrijdag", "Zaterdag", "Zondag"]
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Squash Utrecht</title></head>
+<body>{nav}
+{body}
+</body></html>"""
+
+LOGIN_FORM = """<form id="login-form" method="post" action="/auth/login">
+<input type="hidden" name="_token" value="{token}">
+<input type="email" name="username">
+<input type="password" name="password">
+<button type="submit">Inloggen</button>
+</form>"""
+
+MATRIX_SCRIPT = """<div id="popup"></div>
+<script>
+document.querySelectorAll('td[type="free"]').forEach(function (cell) {
+    cell.addEventListener('click', async function () {
+        var response = await fetch('/reservations/make/' + cell.getAttribute('resource') + '/' + cell.getAttribute('slot'));
+        document.getElementById('popup').innerHTML = await response.text();
+        document.querySelector('a[tooltip="Sluiten"]').addEventListener('click', function (event) {
+            event.preventDefault();
+            document.getElementById('popup').innerHTML = '';
+        });
+    });
+});
+</script>"""
+
+
+def slot_id(date: datetime, start: str) -> str:
+    hour, minute = start.split(":")
+    return str(int(date.replace(hour=int(hour), minute=int(minute)).timestamp()))
+
+
+class MockSite:
+    """In-memory club state served over http from a background thread"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        occupancy: float = 0.5,
+        seed: int = 0,
+        release_at: float | None = None,
+        latency: float = 0,
+        contention: float = 0,
+        future: int = 0,
+    ):
+        self.occupancy = occupancy
+        # Seconds every response is delayed, give or take half of it
+        self.latency = latency
+        # Chance that another member grabs a free slot at each step of booking it
+        self.contention = contention
+        # Epoch seconds before which no slot can be booked, the matrix shows them as closed until then
+        self.release_at = release_at
+        self.random = random.Random(seed)
+        self.sessions: set[str] = set()
+        self.taken: dict[tuple[str, str], bool] = {}
+        self.reservations: list[dict] = []
+        self.lock = threading.Lock()
+        for _ in range(future):
+            self.add_future_reservation()
+
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockSite":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        log.info("Stand-in site listening on %s", self.base_url)
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "MockSite":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def released(self) -> bool:
+        return self.release_at is None or time.time() >= self.release_at
+
+    def is_taken(self, resource: str, slot: str) -> bool:
+        with self.lock:
+            if (resource, slot) not in self.taken:
+                self.taken[(resource, slot)] = self.random.random() < self.occupancy
+            return self.taken[(resource, slot)]
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency * (0.5 + self.random.random()))
+
+    def contend(self, resource: str, slot: str):
+        """Let another member grab the slot, with the configured chance"""
+        with self.lock:
+            if self.contention and not self.taken.get((resource, slot)) and self.random.random() < self.contention:
+                self.taken[(resource, slot)] = True
+                log.info("Another member grabbed %s at %s", COURTS[resource], datetime.fromtimestamp(int(slot)))
+
+    def add_future_reservation(self):
+        day = datetime.combine(datetime.today(), datetime.min.time()) + timedelta(days=self.random.randint(0, 27))
+        resource, start = self.random.choice(list(COURTS)), self.random.choice(TIMES)
+        slot = slot_id(day, start)
+        self.taken[(resource, slot)] = True
+        self.record(resource, slot, ["1148695", self.random.choice(["1409256", "1340920"])])
+
+    def book(self, resource: str, slot: str, players: list[str]) -> bool:
+        with self.lock:
+            if self.taken.get((resource, slot)) or not self.released:
+                return False
+            self.taken[(resource, slot)] = True
+
+        self.record(resource, slot, players)
+        return True
+
+    def record(self, resource: str, slot: str, players: list[str]):
+        start = datetime.fromtimestamp(int(slot))
+        self.reservations.append(
+            {
+                "datum": start.strftime("%d-%m-%Y"),
+                "begintijd": start.strftime("%H:%M"),
+                "baan": COURTS[resource],
+                "spelers": [PLAYERS.get(player, player) for player in players if player],
+            }
+        )
+        log.info("Booked %s at %s", COURTS[resource], start.strftime("%Y-%m-%d %H:%M"))
+
+    def render_matrix(self, date: datetime) -> str:
+        previous_day, next_day = date - timedelta(days=1), date + timedelta(days=1)
+        header = "".join(f'<th class="r-{resource}">{name}</th>' for resource, name in COURTS.items())
+        available = "free" if self.released else "closed"
+        rows = []
+        for start in TIMES:
+            slot = slot_id(date, start)
+            cells = "".join(
+                f'<td class="r-{resource}" resource="{resource}" slot="{slot}" '
+                f'type="{"taken" if self.is_taken(resource, slot) else available}"></td>'
+                for resource in COURTS
+            )
+            rows.append(f'<tr data-time="{start}"><th>{start}</th>{cells}</tr>')
+
+        return (
+            f'<a class="matrix-date-nav" data-offset="-1" href="/reservations/{previous_day:%Y-%m-%d}">&lt;</a>'
+            f'<div id="matrix_date_title">{WEEKDAYS[date.weekday()]} {date:%d-%m-%Y}</div>'
+            f'<a class="matrix-date-nav" data-offset="+1" href="/reservations/{next_day:%Y-%m-%d}">&gt;</a>'
+            f'<table id="matrix"><thead><tr><th></th>{header}</tr></thead><tbody>{"".join(rows)}</tbody></table>'
+            f"{MATRIX_SCRIPT}"
+        )
+
+    def render_make_form(self, resource: str, slot: str) -> str:
+        start = datetime.fromtimestamp(int(slot))
+        options = '<option value="">-</option>' + "".join(
+            f'<option value="{player}">{name}</option>' for player, name in PLAYERS.items()
+        )
+        return (
+            f'<table><tr><td class="tblTitle">Baan</td><td>{COURTS[resource]}</td></tr>'
+            f'<tr><td class="tblTitle">Datum</td><td>{start:%d-%m-%Y %H:%M}</td></tr></table>'
+            f'<form method="post" action="/reservations/make/{resource}/{slot}">'
+            f'<select name="players[1]"><option value="1148695" selected>Jeroen Bos</option></select>'
+            f'<select name="players[2]">{options}</select>'
+            '<input type="submit" id="__make_submit" name="__make_submit" value="Verder">'
+            "</form>"
+            '<a tooltip="Sluiten" href="#">Sluiten</a>'
+        )
+
+    def render_future(self) -> str:
+        today = datetime.today().date()
+        upcoming = sorted(
+            (datetime.strptime(f"{reservation['datum']} {reservation['begintijd']}", "%d-%m-%Y %H:%M"), number)
+            for number, reservation in enumerate(self.reservations)
+            if datetime.strptime(reservation["datum"], "%d-%m-%Y").date() >= today
+        )
+        rows = []
+        for position, (_, number) in enumerate(upcoming):
+            reservation = self.reservations[number]
+            rows.append(
+                f'<tr class="{"odd" if position % 2 == 0 else "even"}">'
+                f'<td><a href="/user/reservations/{number}">{reservation["datum"]}</a></td>'
+                f'<td>{reservation["begintijd"]}</td><td>{reservation["baan"]}</td></tr>'
+            )
+
+        return (
+            '<table><tbody><tr><th colspan="3">Reserveringen</th></tr>'
+            '<tr class="tblTitle"><td>Datum</td><td>Begintijd</td><td>Baan</td></tr>'
+            f'{"".join(rows)}</tbody></table>'
+        )
+
+    def render_reservation(self, number: int) -> str:
+        reservation = self.reservations[number]
+        players = "".join(f'<div class="res-info-player-name">{speler}</div>' for speler in reservation["spelers"])
+        return (
+            f'<div class="res-info"><p>{reservation["baan"]}, {reservation["datum"]} {reservation["begintijd"]}</p>'
+            f"{players}</div>"
+        )
+
+    def render_confirmation(self, resource: str, slot: str, fields: dict[str, str]) -> str:
+        hidden = "".join(f'<input type="hidden" name="{name}" value="{value}">' for name, value in fields.items())
+        return (
+            f"<p>Bevestig je reservering op {COURTS[resource]}</p>"
+            f'<form method="post" action="/reservations/make/{resource}/{slot}">{hidden}'
+            '<input type="submit" id="__make_submit2" name="__make_submit2" value="Bevestigen">'
+            "</form>"
+        )
+
+
+def _handler(site: MockSite):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            log.debug(format, *args)
+
+        @property
+        def session(self) -> str | None:
+            match = re.search(r"session=(\w+)", self.headers.get("Cookie", ""))
+            if match and match.group(1) in site.sessions:
+                return match.group(1)
+            return None
+
+        def send_html(self, body: str, status: int = 200, fragment: bool = False, headers: dict | None = None):
+            if not fragment:
+                nav = '<a href="/auth/logout">Uitloggen</a>' if self.session else ""
+                body = PAGE.format(nav=nav, body=body)
+            payload = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def redirect(self, location: str, headers: dict | None = None):
+            self.send_response(303)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+
+        def read_form(self) -> dict[str, str]:
+            length = int(self.headers.get("Content-Length", 0))
+            return {key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+
+        def do_GET(self):
+            site.delay()
+            path = self.path.split("?")[0]
+
+            if path == "/":
+                if self.session:
+                    # The landing page after logging in shows the matrix of today
+                    return self.send_html(site.render_matrix(datetime.combine(datetime.today(), datetime.min.time())))
+                return self.send_html(LOGIN_FORM.format(token=secrets.token_hex(8)))
+
+            if path == "/auth/logout":
+                site.sessions.discard(self.session)
+                return self.redirect("/")
+
+            if not self.session:
+                return self.redirect("/")
+
+            if match := re.fullmatch(r"/reservations/(\d{4}-\d{2}-\d{2})", path):
+                return self.send_html(site.render_matrix(datetime.strptime(match.group(1), "%Y-%m-%d")))
+
+            if match := re.fullmatch(r"/reservations/make/(\w+)/(\d+)", path):
+                resource, slot = match.groups()
+                if resource in COURTS:
+                    site.contend(resource, slot)
+                if resource not in COURTS or site.is_taken(resource, slot) or not site.released:
+                    return self.send_html("<p>Deze baan is niet meer beschikbaar</p>", fragment=True)
+                return self.send_html(site.render_make_form(resource, slot), fragment=True)
+
+            if path == "/user/future":
+                return self.send_html(site.render_future())
+
+            if match := re.fullmatch(r"/user/reservations/(\d+)", path):
+                if int(match.group(1)) < len(site.reservations):
+                    return self.send_html(site.render_reservation(int(match.group(1))))
+
+            self.send_html("<p>Niet gevonden</p>", status=404)
+
+        def do_POST(self):
+            site.delay()
+            path = self.path.split("?")[0]
+            form = self.read_form()
+
+            if path == "/auth/login":
+                if not form.get("username") or not form.get("password"):
+                    return self.send_html(LOGIN_FORM.format(token=secrets.token_hex(8)), status=401)
+                session = secrets.token_hex(16)
+                site.sessions.add(session)
+                return self.redirect("/", headers={"Set-Cookie": f"session={session}; Path=/; HttpOnly"})
+
+            if not self.session:
+                return self.redirect("/")
+
+            if match := re.fullmatch(r"/reservations/make/(\w+)/(\d+)", path):
+                resource, slot = match.groups()
+                if resource in COURTS:
+                    site.contend(resource, slot)
+                if resource not in COURTS or site.is_taken(resource, slot) or not site.released:
+                    return self.send_html("<p>Deze baan is niet meer beschikbaar</p>", status=409)
+
+                if "__make_submit2" in form:
+                    if not site.book(resource, slot, [form.get("players[1]"), form.get("players[2]")]):
+                        return self.send_html("<p>Deze baan is niet meer beschikbaar</p>", status=409)
+                    return self.send_html("<p>Je reservering is geplaatst</p>")
+
+                fields = {name: value for name, value in form.items() if name != "__make_submit"}
+                return self.send_html(site.render_confirmation(resource, slot, fields))
+
+            self.send_html("<p>Niet gevonden</p>", status=404)
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--occupancy", type=float, default=0.5, help="Fraction of the slots that is already taken")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--release-in", type=float, default=None, help="Release the slots after this many seconds")
+    parser.add_argument("--latency", type=float, default=0, help="Average delay of every response in seconds")
+    parser.add_argument("--contention", type=float, default=0, help="Chance another member grabs a slot per step")
+    parser.add_argument("--future", type=int, default=0, help="Number of future reservations to start with")
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    site = MockSite(
+        port=cli_args.port,
+        occupancy=cli_args.occupancy,
+        seed=cli_args.seed,
+        release_at=None if cli_args.release_in is None else time.time() + cli_args.release_in,
+        latency=cli_args.latency,
+        contention=cli_args.contention,
+        future=cli_args.future,
+    )
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        site.stop()
@@ -3,11 +3,91 @@ from datetime import date
 from pydantic import BaseModel, BaseSettings, Field
 
 
+class CalendarView(BaseModel):
+    player: str = Field(default=None, description="Only the reservations this player plays in, everyone's if unset")
+    member: str = Field(
+        default=None,
+        description="Name in the opponents map whose reservations page the events link to, defaults to the player. "
+        "Unknown names link to the own reservations page",
+    )
+    placeholder_weeks: int = Field(default=8, description="Weeks of placeholders in the feed")
+
+
 class Settings(BaseSettings):
     dry_run: bool = Field(ENV="DRY_RUN", default=True, description="Don't actually place the reservation")
-    username: str = Field(env="BR_USERNAME", description="Baanreserveren username")
-    password: str = Field(env="BR_PASSWORD", description="Baanreserveren password")
+    username: str = Field(env="BR_USERNAME", default=None, description="Baanreserveren username")
+    password: str = Field(env="BR_PASSWORD", default=None, description="Baanreserveren password")
     headless: bool = Field(env="HEADLESS", default=True, description="Run browser in headless mode")
+    login_timeout: float = Field(env="LOGIN_TIMEOUT", default=10, description="Seconds to wait for the login")
+    date_timeout: float = Field(env="DATE_TIMEOUT", default=10, description="Seconds to wait for the matrix of a date")
+    slot_timeout: float = Field(env="SLOT_TIMEOUT", default=5, description="Seconds to wait for the popup of a slot")
+    submit_timeout: float = Field(env="SUBMIT_TIMEOUT", default=10, description="Seconds to wait for a submit step")
+    step_retries: int = Field(
+        env="STEP_RETRIES",
+        default=2,
+        description="How often a step of the browser booking is retried after a transient failure, time permitting",
+    )
+    session_cache: Literal["kv", "file", "off"] = Field(
+        env="SESSION_CACHE", default="kv", description="Where to cache the logged in session between runs"
+    )
+    session_store: str = Field(
+        env="SESSION_STORE",
+        default="baanreserveren-sessions",
+        description="Named key-value store the sessions are cached in, it outlives the runs",
+    )
+    session_dir: str = Field(env="SESSION_DIR", default=".sessions", description="Directory of the file session cache")
+    base_url: str = Field(
+        env="BR_BASE_URL", default=None, description="Override the club url, e.g. to point at a local stand-in site"
+    )
+    calendar_bucket: str = Field(
+        env="CALENDAR_BUCKET", default="apify-squash-utrecht", description="S3 bucket the calendar files go to"
+    )
+    calendar_prefix: str = Field(
+        env="CALENDAR_PREFIX", default="calendar", description="Key prefix of the calendar files in the bucket"
+    )
+    calendar_views: list[CalendarView] = Field(
+        env="CALENDAR_VIEWS",
+        default=[CalendarView(member="jeroen"), CalendarView(player="jeroen"), CalendarView(player="vera")],
+        description="The calendar feeds to publish, as json",
+    )
+    opponents: dict[str, str] = Field(
+        env="BR_OPPONENTS",
+        default={"vera": "1409256", "koen": "1340920", "jeroen": "1148695"},
+        description="The member ids of the opponents at the club, as json",
+    )
+    trace_browser: bool = Field(
+        env="TRACE_BROWSER",
+        default=False,
+        description="Record a Playwright trace, kept when the run fails or is slow. Off by default, recording the "
+        "snapshots slows down every step of the booking",
+    )
+    trace_threshold_seconds: float = Field(
+        env="TRACE_THRESHOLD_SECONDS",
+        default=20,
+        description="Keep the Playwright trace of runs that are active longer than this, waits for the release excluded",
+    )
+    standby_port: int = Field(
+        env="STANDBY_PORT", default=None, description="Stand by with a warm browser and take jobs on this port"
+    )
+    standby_host: str = Field(env="STANDBY_HOST", default="127.0.0.1", description="Interface the standby api binds to")
+    standby_token: str = Field(
+        env="STANDBY_TOKEN", default=None, description="Bearer token the standby api requires, if set"
+    )
+    standby_refresh_seconds: float = Field(
+        env="STANDBY_REFRESH_SECONDS", default=300, description="How often to check the session while standing by"
+    )
+    registry: str = Field(
+        env="BR_REGISTRY",
+        default=None,
+        description="Path of a json file with the clubs, accounts and jobs to schedule in one run",
+    )
+
+
+class BookingJob(BaseModel):
+    reservation_date: str = Field(description="The date to book a slot on, format: yyyy-mm-dd")
+    times: list[str] = Field(default=None, description="The times to try, defaults to the times of the run")
+    opponent: str = Field(default=None, description="Defaults to the opponent of the run")
+    leden_only: bool = Field(default=None, description="Defaults to the leden_only setting of the run")
 
 
 class Input(BaseModel):
@@ -16,16 +96,75 @@ class Input(BaseModel):
         description="Scrape the reservations and update the ical file. If true, the other fields are ignored",
     )
     dry_run: bool = Field(default=True, description="Don't actually place the reservation")
+    engine: Literal["playwright", "http"] = Field(
+        default="playwright",
+        description="Book through a browser or through plain http form posts. The http engine falls back to the browser",
+    )
     reservation_date: str = Field(
         default=None, description="The date to book a slot on, format: yyyy-mm-dd. Defaults to one week from now"
     )
+    release_at: str = Field(
+        default=None,
+        description="When the slots are released, format: yyyy-mm-ddThh:mm:ss(.ffffff), Europe/Amsterdam time unless "
+        "an offset is given. The booking is prepared before and fired exactly at this instant. The http engine ranks "
+        "the slots before the release and posts the best one right away. The browser only gets its slots clickable "
+        "by loading the released matrix, so there pre-arming saves the launch and the login, not loading the date",
+    )
+    prearm_seconds: int = Field(
+        default=30, description="How many seconds before the release to log in and open the reservation date"
+    )
+    keep_warm_seconds: int = Field(
+        default=20, description="How often to touch the session while waiting for the release, in seconds"
+    )
+    lean_browser: bool = Field(
+        default=False,
+        description="Block images, stylesheets, fonts and third-party requests and launch a slimmer browser for booking",
+    )
+    race_concurrency: int = Field(
+        default=1,
+        description="How many candidate slots to try in parallel, the first one to reach the confirmation is booked",
+    )
+    watch_minutes: int = Field(
+        default=0,
+        description="When no preferred slot is free, keep watching the date for cancellations this many minutes. "
+        "0 disables watching",
+    )
+    watch_min_interval: int = Field(
+        default=15, description="Seconds between polls right after a change and close to the preferred times"
+    )
+    watch_max_interval: int = Field(default=300, description="Seconds between polls after backing off")
+    watch_rush_minutes: int = Field(
+        default=120, description="Poll at the tightest interval from this many minutes before a preferred time"
+    )
+    watch_poll_budget: int = Field(
+        default=5, description="Seconds a single poll may take, slower polls are abandoned and stretch the interval"
+    )
+    jobs: list[BookingJob] = Field(
+        default=[],
+        description="Book several dates in one run over one login, e.g. "
+        '[{"reservation_date": "2024-01-08", "opponent": "koen", "times": ["19:45"]}]. '
+        "Fields left out are taken from this input, reservation_date and opponent are ignored when jobs are given",
+    )
+    job_concurrency: int = Field(default=3, description="How many dates of the jobs to book at the same time")
+    placeholder_pattern: list[str] = Field(
+        default=["MO 20:30", "WE 20:30"],
+        description="The weekly sessions shown as placeholders in the calendars until they are booked, as weekday "
+        "(MO, TU, WE, TH, FR, SA, SU) and time",
+    )
+    feed_window_days: int = Field(
+        default=60,
+        description="Next to the full calendar feeds, publish -recent.ics feeds with the reservations of this many "
+        "days back and the future ones. 0 disables them",
+    )
     reservation_default: Literal["next_week", "today"] = Field(
         default="next_week", description="The default date to book a slot on if no explicit date is given"
     )
     reservation_skip: list[str] = Field(
         default=[], description="The dates to skip when trying to book a slot, format: yyyy-mm-dd"
     )
-    opponent: Literal["vera", "koen"] = Field(default="vera", description="The opponent to book a slot with")
+    opponent: str = Field(
+        default="vera", description="The opponent to book a slot with, one of the names of the opponents setting"
+    )
     times: list[str] = Field(
         default=["20:30", "19:45"],
         description="The times to try to book a slot on the leden banen",
@@ -35,6 +174,48 @@ class Input(BaseModel):
         default=["20:15", "19:30"],
         description="The times to try to book a slot on the non-leden banen",
     )
+    excluded_courts: list[str] = Field(
+        default=["Court 1 "],
+        description="Courts that are never booked, matched on the start of the court name. Court 1 needs to be "
+        "booked via the reception",
+    )
+
+    def for_job(self, job: BookingJob) -> "Input":
+        """The input of a single booking job, with the fields the job leaves out taken from this input"""
+        return self.copy(update={**job.dict(exclude_none=True), "jobs": []})
+
+
+class Club(BaseModel):
+    base_url: str = Field(description="The url of the baanreserveren site of the club")
+    rate_limit: float = Field(default=5, description="Requests per second to the club, shared by all its accounts")
+    opponents: dict[str, str] = Field(default=None, description="The member ids of the opponents at the club")
+    calendar_bucket: str = Field(default=None, description="S3 bucket for the calendar files of the club")
+
+
+class Account(BaseModel):
+    club: str = Field(description="Name of the club in the registry")
+    username: str = Field(description="Baanreserveren username")
+    password: str = Field(default=None, description="Baanreserveren password")
+    password_env: str = Field(default=None, description="Environment variable holding the password")
+    calendar_bucket: str = Field(default=None, description="S3 bucket for the calendar files, defaults to the club's")
+    calendar_prefix: str = Field(
+        default=None,
+        description="Key prefix of the calendar files, defaults to calendar/<account> so accounts sharing a bucket "
+        "don't overwrite each other's files",
+    )
+    calendar_views: list[CalendarView] = Field(default=None, description="The calendar feeds of the account")
+
+
+class ScheduledJob(BaseModel):
+    account: str = Field(description="Name of the account in the registry")
+    input: Input = Field(default=Input(), description="The input of the job, as for a single run")
+
+
+class Registry(BaseModel):
+    clubs: dict[str, Club]
+    accounts: dict[str, Account]
+    jobs: list[ScheduledJob] = []
+    contexts: int = Field(default=3, description="How many accounts get a browser context at the same time")
 
 
 if __name__ == "__main__":
@@ -55,8 +236,14 @@ if __name__ == "__main__":
                 field["prefill"] = field["default"]
 
         if field["type"] == "array":
-            if field["items"]["type"] == "string":
+            if field["items"].get("type") == "string":
                 field["editor"] = "stringList"
+            else:
+                # Lists of objects are edited as plain json
+                field["editor"] = "json"
+                del field["items"]
+
+    json_schema.pop("definitions", None)
 
     json_schema["title"] = "Baanreserveren Actor"
     json_schema["schemaVersion"] = 1
@@ -0,0 +1,110 @@
+"""
+Race several candidate slots in parallel and commit only the first one that reaches the confirmation step.
+
+Every attempt runs up to the confirmation step on its own and then has to `claim` the race before sending the final
+submit. Claiming is a check-and-set without an await in between, so on the event loop exactly one attempt can win and
+the final submit is never sent twice. Attempts that lose are cancelled.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Candidate:
+    time: str
+    rank: int
+    # Engine specific handle on the slot, e.g. the matrix cell or the index of the free cell at the time
+    slot: Any = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.time}#{self.rank}"
+
+
+class Race:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.winner: Candidate | None = None
+        self.claimed = asyncio.Event()
+        self.timeline: list[tuple[float, str, str]] = []
+
+    def mark(self, candidate: Candidate, phase: str):
+        self.timeline.append(((time.monotonic() - self.started) * 1000, candidate.label, phase))
+
+    def claim(self, candidate: Candidate) -> bool:
+        if self.winner is not None:
+            self.mark(candidate, "lost")
+            return False
+
+        self.winner = candidate
+        self.claimed.set()
+        self.mark(candidate, "claimed")
+        return True
+
+    def log_timeline(self):
+        for elapsed, label, phase in self.timeline:
+            log.info("%8.1f ms  %-10s %s", elapsed, label, phase)
+
+
+async def run_race(
+    candidates: list[Candidate],
+    attempt: Callable[[Candidate, Race], Awaitable[bool]],
+    concurrency: int,
+) -> Candidate | None:
+    """Try the candidates with at most `concurrency` attempts in flight, best ranked first"""
+    race = Race()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(candidate: Candidate) -> bool:
+        async with semaphore:
+            if race.winner is not None:
+                return False
+
+            race.mark(candidate, "started")
+            try:
+                return await attempt(candidate, race)
+            except asyncio.CancelledError:
+                race.mark(candidate, "cancelled")
+                raise
+            except Exception as e:
+                race.mark(candidate, f"failed: {e}")
+                if race.winner is candidate:
+                    # The final submit may have been sent, the other attempts can't take over
+                    raise
+                return False
+
+    log.info("Racing %s candidates with %s in parallel", len(candidates), concurrency)
+    tasks = {asyncio.create_task(run(candidate)): candidate for candidate in candidates}
+    claimed = asyncio.create_task(race.claimed.wait())
+    pending = set(tasks)
+
+    try:
+        while pending and race.winner is None:
+            _, pending = await asyncio.wait(pending | {claimed}, return_when=asyncio.FIRST_COMPLETED)
+            pending.discard(claimed)
+
+        # Let the winner finish its final submit, everything else is cancelled
+        winner_task = next((task for task, candidate in tasks.items() if candidate is race.winner), None)
+        for task in pending - {winner_task}:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        if winner_task is not None:
+            # Raises when the final submit of the winner failed
+            winner_task.result()
+    finally:
+        claimed.cancel()
+        for task in tasks:
+            task.cancel()
+        race.log_timeline()
+
+    if race.winner is not None:
+        log.info("Won the race with %s after %.1f ms", race.winner.label, (time.monotonic() - race.started) * 1000)
+
+    return race.winner
@@ -0,0 +1,96 @@
+"""
+Helpers to prepare a booking before the slots are released and fire it at the release instant.
+
+Waiting happens against the monotonic clock: the wall clock is only read once to convert the release instant into a
+monotonic deadline, so clock adjustments while waiting can't shift the moment we fire.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from src.models import Input
+from src.tracing import traced
+
+log = logging.getLogger(__name__)
+
+RELEASE_TIMEZONE = "Europe/Amsterdam"
+# The last stretch before the release is spent spinning, sleeping isn't precise enough for it
+SPIN_SECONDS = 0.05
+# Stop keeping the session warm this long before the release, so no request is in flight when we fire
+WARM_QUIET_SECONDS = 2
+
+
+def release_instant(args: Input) -> datetime | None:
+    if args.release_at is None:
+        return None
+
+    release = datetime.fromisoformat(args.release_at)
+    if release.tzinfo is None:
+        # Only pre-armed runs need the timezone database
+        import pytz
+
+        release = pytz.timezone(RELEASE_TIMEZONE).localize(release)
+
+    return release
+
+
+def seconds_until(release: datetime) -> float:
+    return (release - datetime.now(timezone.utc)).total_seconds()
+
+
+def run_budget(args: Input, run_timeout: timedelta) -> float:
+    """The number of seconds the run may take, which includes the wait for the release and the watch"""
+    # The jobs of a batch could end up running one after the other
+    budget = (run_timeout.total_seconds() + args.watch_minutes * 60) * max(len(args.jobs), 1)
+    release = release_instant(args)
+    if release is None:
+        return budget
+
+    return max(seconds_until(release), 0) + budget
+
+
+@traced()
+async def sleep_until_prearm(args: Input):
+    release = release_instant(args)
+    if release is None:
+        return
+
+    delay = seconds_until(release) - args.prearm_seconds
+    if delay > 0:
+        log.info("Release at %s, sleeping %.1f s before preparing the booking", release.isoformat(), delay)
+        await asyncio.sleep(delay)
+
+
+@traced()
+async def wait_for_release(
+    release: datetime,
+    keep_warm: Callable[[], Awaitable] | None = None,
+    keep_warm_seconds: float = 20,
+) -> float:
+    """Wait until the release instant, keeping the session warm meanwhile. Returns the monotonic target"""
+    target = time.monotonic() + seconds_until(release)
+    log.info("Armed, firing in %.3f s at %s", target - time.monotonic(), release.isoformat())
+
+    while keep_warm is not None and target - time.monotonic() > keep_warm_seconds + WARM_QUIET_SECONDS:
+        await asyncio.sleep(keep_warm_seconds)
+        started = time.monotonic()
+        try:
+            # A slow request must not run into the quiet window before the release
+            await asyncio.wait_for(keep_warm(), target - started - WARM_QUIET_SECONDS)
+            log.debug("Kept the session warm in %.0f ms", (time.monotonic() - started) * 1000)
+        except Exception as e:
+            # Missing one touch of the session is no reason to miss the release
+            log.warning("Keeping the session warm failed: %s", str(e) or type(e).__name__)
+
+    remaining = target - time.monotonic() - SPIN_SECONDS
+    if remaining > 0:
+        await asyncio.sleep(remaining)
+
+    while time.monotonic() < target:
+        pass
+
+    log.info("Firing %+.3f ms from the release instant", (time.monotonic() - target) * 1000)
+    return target
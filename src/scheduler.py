@@ -0,0 +1,159 @@
+"""
+Runs the reservation and calendar jobs of several accounts, possibly at several clubs, in one browser.
+
+Every account gets its own browser contexts, so cookies never leak between accounts, and at most `Registry.contexts`
+contexts are open at the same time. The jobs of one account run one after the other, each on a fresh context that is
+only opened once a pre-armed job is done waiting for its release, so a long wait doesn't keep a context from the other
+accounts. The accounts run concurrently. All requests to a club pass through one rate limiter per club, whichever
+account sends them: the documents and xhr requests of the pages and the requests sent with `context_get`.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+
+from apify import Actor
+from playwright.async_api import Page, Playwright
+
+from src.baanreserveren import DEVICE, PATH_LOGIN, RUN_TIMEOUT, run_reserver, site_url
+from src.browser import RateLimiter, install_rate_limit
+from src.models import Registry, ScheduledJob, Settings
+from src.release import run_budget, sleep_until_prearm
+from src.session import load_session
+from src.steps import deadline_after
+from src.tracing import trace_run
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ScheduledResult:
+    account: str
+    club: str
+    kind: str
+    status: str
+    seconds: float
+    error: str | None = None
+
+
+def account_settings(settings: Settings, registry: Registry, name: str) -> Settings:
+    """The settings of the run with the credentials and the club of the account"""
+    account = registry.accounts[name]
+    club = registry.clubs[account.club]
+    password = account.password
+    if account.password_env is not None:
+        if account.password_env not in os.environ:
+            raise ValueError(f"Set {account.password_env} to the password of account {name}")
+        password = os.environ[account.password_env]
+
+    update = {
+        "username": account.username,
+        "password": password,
+        "base_url": club.base_url,
+        "calendar_prefix": account.calendar_prefix or f"calendar/{name}",
+    }
+    if account.calendar_bucket or club.calendar_bucket:
+        update["calendar_bucket"] = account.calendar_bucket or club.calendar_bucket
+    if club.opponents:
+        update["opponents"] = club.opponents
+    if account.calendar_views:
+        update["calendar_views"] = account.calendar_views
+    return settings.copy(update=update)
+
+
+def job_kind(job: ScheduledJob) -> str:
+    return "calendar" if job.input.update_calendar else "batch" if job.input.jobs else "reservation"
+
+
+async def run_scheduled_job(settings: Settings, name: str, club: str, job: ScheduledJob, page: Page):
+    kind = job_kind(job)
+    started = time.monotonic()
+    try:
+        async with trace_run(
+            kind, account=name, club=club, engine=job.input.engine, dry_run=settings.dry_run or job.input.dry_run
+        ):
+            if job.input.update_calendar:
+                # Imported here, the calendar dependencies aren't needed when only booking
+                from src.calendar_updater import run_calendar_updater
+
+                await run_calendar_updater(settings=settings, args=job.input, page=page)
+            elif job.input.jobs:
+                from src.batch import run_batch
+
+                await run_batch(settings=settings, args=job.input, page=page)
+            else:
+                await run_reserver(settings=settings, args=job.input, page=page)
+        status, error = "done", None
+    except Exception as e:
+        log.exception("The %s job of %s failed", kind, name)
+        status, error = "failed", str(e) or type(e).__name__
+
+    return ScheduledResult(name, club, kind, status, round(time.monotonic() - started, 3), error)
+
+
+async def run_scheduler(settings: Settings, registry: Registry, playwright: Playwright) -> list[ScheduledResult]:
+    browser = await playwright.chromium.launch(headless=settings.headless)
+    device = playwright.devices[DEVICE]
+    limiters = {name: RateLimiter(club.rate_limit) for name, club in registry.clubs.items()}
+    contexts = asyncio.Semaphore(registry.contexts)
+
+    by_account: dict[str, list[ScheduledJob]] = defaultdict(list)
+    for job in registry.jobs:
+        by_account[job.account].append(job)
+    log.info("Running %s jobs of %s accounts, %s at a time", len(registry.jobs), len(by_account), registry.contexts)
+
+    async def run_account(name: str, jobs: list[ScheduledJob]) -> list[ScheduledResult]:
+        club = registry.accounts[name].club
+
+        results = []
+        for job in jobs:
+            try:
+                # Resolved per job, an account with missing credentials only fails its own jobs
+                settings_of_account = account_settings(settings, registry, name)
+            except Exception as e:
+                log.error("The %s job of %s failed: %s", job_kind(job), name, e)
+                result = ScheduledResult(name, club, job_kind(job), "failed", 0, str(e))
+                await Actor.push_data(asdict(result))
+                results.append(result)
+                continue
+
+            with deadline_after(run_budget(job.input, RUN_TIMEOUT)):
+                if not job.input.update_calendar:
+                    # Waiting for a release doesn't hold a context, the other accounts may need it meanwhile
+                    await sleep_until_prearm(job.input)
+
+                async with contexts:
+                    # The session is cached, so a fresh context per job only costs loading it
+                    context = await browser.new_context(**device, storage_state=await load_session(settings_of_account))
+                    try:
+                        await install_rate_limit(context, site_url(settings_of_account, PATH_LOGIN), limiters[club])
+                        page = await context.new_page()
+                        result = await run_scheduled_job(settings_of_account, name, club, job, page)
+                    finally:
+                        await context.close()
+
+            await Actor.push_data(asdict(result))
+            results.append(result)
+        return results
+
+    try:
+        results = [
+            result
+            for results in await asyncio.gather(*[run_account(name, jobs) for name, jobs in by_account.items()])
+            for result in results
+        ]
+    finally:
+        await browser.close()
+
+    for name, limiter in limiters.items():
+        log.info("Delayed %s requests to %s to stay within %s per second", limiter.delayed, name, 1 / limiter.interval)
+
+    failed = [result for result in results if result.status != "done"]
+    log.info("Finished %s of %s jobs", len(results) - len(failed), len(results))
+    if failed:
+        raise Exception(f"Failed jobs: {', '.join(f'{result.kind} of {result.account}' for result in failed)}")
+
+    return results
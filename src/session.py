@@ -0,0 +1,82 @@
+"""
+Cache of the authenticated session, so warm runs can skip the login round trip.
+
+The cookies are stored in the Playwright storage state format, in a named Apify key-value store or in a local file, and
+are shared by the browser and the http engine. A cached session is only used after a cheap probe confirmed it is
+still logged in.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import httpx
+from apify import Actor
+
+from src.models import Settings
+
+log = logging.getLogger(__name__)
+
+
+def session_key(settings: Settings, slot: int = 0) -> str:
+    # Key-value store keys only allow a limited set of characters, and the username shouldn't end up in it
+    key = "session-" + hashlib.sha1(f"{settings.base_url}:{settings.username}".encode("utf-8")).hexdigest()[:16]
+    # Racers each have a session of their own, next to the one of the run
+    return f"{key}-{slot}" if slot else key
+
+
+async def open_session_store(settings: Settings):
+    # The default store of a run is new for every run, only a named store outlives it
+    return await Actor.open_key_value_store(name=settings.session_store)
+
+
+async def load_session(settings: Settings, slot: int = 0) -> dict | None:
+    key = session_key(settings, slot)
+    if settings.session_cache == "kv":
+        state = await (await open_session_store(settings)).get_value(key)
+    elif settings.session_cache == "file" and (path := Path(settings.session_dir) / f"{key}.json").exists():
+        state = json.loads(path.read_text("utf-8"))
+    else:
+        state = None
+
+    log.info("Session cache %s for %s", "hit" if state else "miss", key)
+    return state
+
+
+async def save_session(settings: Settings, state: dict, slot: int = 0):
+    key = session_key(settings, slot)
+    if settings.session_cache == "kv":
+        await (await open_session_store(settings)).set_value(key, state)
+    elif settings.session_cache == "file":
+        path = Path(settings.session_dir) / f"{key}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(state), "utf-8")
+    else:
+        return
+
+    log.info("Stored session %s with %s cookies", key, len(state.get("cookies", [])))
+
+
+def cookies_to_state(cookies: httpx.Cookies) -> dict:
+    return {
+        "cookies": [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path or "/",
+                "expires": cookie.expires or -1,
+                "httpOnly": cookie.has_nonstandard_attr("HttpOnly"),
+                "secure": cookie.secure,
+                "sameSite": "Lax",
+            }
+            for cookie in cookies.jar
+        ],
+        "origins": [],
+    }
+
+
+def state_to_cookies(state: dict, cookies: httpx.Cookies):
+    for cookie in state.get("cookies", []):
+        cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie.get("path", "/"))
@@ -0,0 +1,214 @@
+"""
+Standby mode: keep the browser and the logged in session warm and run the jobs posted to a small local http api.
+
+    GET  /health     state of the browser, the session and the jobs
+    POST /book       book a slot, the json body is an `Input` (empty for the defaults)
+    POST /calendar   refresh the calendar files
+
+A job answers with its result once it is done. While idle the session is checked in the background, so a job starts
+right away on a new page of the warm context. To try it against the stand-in site:
+
+    python -m src.mock_site --port 8000
+    BR_BASE_URL=http://127.0.0.1:8000 STANDBY_PORT=8080 SESSION_CACHE=off python -m src
+    curl -X POST localhost:8080/book -d '{"reservation_date": "2024-01-08"}'
+"""
+
+import asyncio
+import json
+import logging
+import time
+from contextlib import suppress
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright
+from pydantic import ValidationError
+
+from src.baanreserveren import DEVICE, RUN_TIMEOUT, ensure_logged_in, reserve
+from src.models import Input, Settings
+from src.release import run_budget, sleep_until_prearm
+from src.session import load_session
+from src.steps import deadline_after
+from src.tracing import trace_run
+
+log = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class Standby:
+    def __init__(self, settings: Settings, playwright: Playwright):
+        self.settings = settings
+        self.playwright = playwright
+        self.browser: Browser | None = None
+        self.context: BrowserContext | None = None
+        self.page: Page | None = None
+        self.started = time.monotonic()
+        self.last_check = 0.0
+        self.session_lock = asyncio.Lock()
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+
+    async def launch(self):
+        started = time.monotonic()
+        self.browser = await self.playwright.chromium.launch(headless=self.settings.headless)
+        self.context = await self.browser.new_context(
+            **self.playwright.devices[DEVICE], storage_state=await load_session(self.settings)
+        )
+        self.page = await self.context.new_page()
+        await self.check_session(force=True)
+        log.info("Browser warm and logged in after %.0f ms", (time.monotonic() - started) * 1000)
+
+    async def close(self):
+        """Close the context and the browser, which may already be half gone after a disconnect"""
+        for closable in (self.context, self.browser):
+            if closable is not None:
+                with suppress(Exception):
+                    await closable.close()
+        self.browser = self.context = self.page = None
+
+    async def check_session(self, force: bool = False):
+        """Make sure the context is logged in, unless that was checked less than a refresh interval ago"""
+        async with self.session_lock:
+            if force or time.monotonic() - self.last_check > self.settings.standby_refresh_seconds:
+                await ensure_logged_in(self.settings, self.page)
+                self.last_check = time.monotonic()
+
+    async def keep_warm(self):
+        while True:
+            await asyncio.sleep(self.settings.standby_refresh_seconds)
+            try:
+                if self.browser is None or not self.browser.is_connected():
+                    log.warning("The browser is gone, launching a new one")
+                    await self.close()
+                    await self.launch()
+                elif not self.running:
+                    await self.check_session(force=True)
+            except Exception:
+                log.exception("Refreshing the session failed")
+
+    async def run_job(self, args: Input) -> dict:
+        kind = "calendar" if args.update_calendar else "booking"
+        started = time.monotonic()
+        self.running += 1
+        page = None
+        try:
+            # Traced like a run of its own, under the same kinds
+            trace_kind = "calendar" if args.update_calendar else "batch" if args.jobs else "reservation"
+            async with trace_run(
+                trace_kind, mode="standby", engine=args.engine, dry_run=self.settings.dry_run or args.dry_run
+            ):
+                await self.check_session()
+                page = await self.context.new_page()
+
+                if args.update_calendar:
+                    # Imported here, the calendar dependencies aren't needed when only booking
+                    from src.calendar_updater import run_calendar_updater
+
+                    await run_calendar_updater(settings=self.settings, args=args, page=page)
+                elif args.jobs:
+                    from src.batch import run_batch
+
+                    await run_batch(settings=self.settings, args=args, page=page)
+                else:
+                    # The retries of a job get the budget a run of its own would get
+                    with deadline_after(run_budget(args, RUN_TIMEOUT)):
+                        await sleep_until_prearm(args)
+                        await reserve(settings=self.settings, args=args, page=page)
+            status, error = "done", None
+            self.done += 1
+        except Exception as e:
+            log.exception("The %s job failed", kind)
+            status, error = "failed", str(e) or type(e).__name__
+            self.failed += 1
+        finally:
+            self.running -= 1
+            if page is not None:
+                await page.close()
+
+        seconds = time.monotonic() - started
+        log.info("Finished the %s job in %.0f ms: %s", kind, seconds * 1000, status)
+        return {"kind": kind, "status": status, "seconds": round(seconds, 3), "error": error}
+
+    def health(self) -> tuple[HTTPStatus, dict]:
+        connected = self.browser is not None and self.browser.is_connected()
+        return HTTPStatus.OK if connected else HTTPStatus.SERVICE_UNAVAILABLE, {
+            "status": "ok" if connected else "browser down",
+            "uptime_seconds": round(time.monotonic() - self.started),
+            "session_checked_seconds_ago": round(time.monotonic() - self.last_check),
+            "jobs_running": self.running,
+            "jobs_done": self.done,
+            "jobs_failed": self.failed,
+        }
+
+    async def respond(self, reader: asyncio.StreamReader) -> tuple[HTTPStatus, dict]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return HTTPStatus.BAD_REQUEST, {"error": "Malformed request"}
+        method, target, _ = request_line
+
+        headers = {}
+        while line := (await reader.readline()).decode("latin-1").strip():
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Body too large"}
+        body = await reader.readexactly(length) if length else b""
+
+        token = self.settings.standby_token
+        if token and headers.get("authorization") != f"Bearer {token}":
+            return HTTPStatus.UNAUTHORIZED, {"error": "Missing or wrong token"}
+
+        path = urlparse(target).path
+        if path == "/health":
+            return self.health() if method == "GET" else (HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use GET"})
+        if path not in ("/book", "/calendar"):
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST"}
+
+        try:
+            args = Input(**(json.loads(body) if body else {}))
+        except (ValueError, ValidationError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        if path == "/calendar":
+            args = args.copy(update={"update_calendar": True})
+
+        result = await self.run_job(args)
+        return HTTPStatus.OK if result["status"] == "done" else HTTPStatus.INTERNAL_SERVER_ERROR, result
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            status, body = await self.respond(reader)
+        except Exception as e:
+            log.exception("Handling the request failed")
+            status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+        payload = json.dumps(body).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode()
+            + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def run_standby(settings: Settings, playwright: Playwright):
+    standby = Standby(settings, playwright)
+    await standby.launch()
+
+    server = await asyncio.start_server(standby.handle, settings.standby_host, settings.standby_port)
+    log.info("Standing by on http://%s:%s", settings.standby_host, settings.standby_port)
+    refresher = asyncio.create_task(standby.keep_warm())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+        await standby.close()
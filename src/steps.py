@@ -0,0 +1,103 @@
+"""
+Retries of the steps of the booking flow, bounded by the deadline of the run.
+
+Every step of the flow ends in a checkpoint (logged in, on the date, slot opened, confirmation step). When a step fails
+on something transient, e.g. a timeout or a stale locator, it is recovered from the last checkpoint and tried again,
+instead of failing the run. A retry is only started when its worst case, the timeout of the step plus the steps after
+it, still fits before the deadline; otherwise the failure is raised right away, while there is time left to fall back.
+Outside a run with a deadline only the number of retries bounds them.
+"""
+
+import logging
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from playwright.async_api import Error as PlaywrightError
+
+from src.tracing import record
+from src.waits import StepTimeout
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Failures a retry can get past, anything else (e.g. wrong credentials, a date in the past) fails the step right away
+RETRYABLE = (StepTimeout, PlaywrightError)
+
+
+@dataclass
+class Deadline:
+    # Monotonic instant, the same clock as the one of the event loop
+    at: float = math.inf
+
+    @property
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    def fits(self, seconds: float) -> bool:
+        return self.remaining > seconds
+
+
+_deadline: ContextVar[Deadline] = ContextVar("deadline", default=Deadline())
+
+
+def current_deadline() -> Deadline:
+    return _deadline.get()
+
+
+@contextmanager
+def deadline_at(at: float | None):
+    """Bound the retries of the steps inside the block by the monotonic instant `at`, if given"""
+    token = _deadline.set(Deadline(at) if at is not None else Deadline())
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def deadline_after(seconds: float):
+    with deadline_at(time.monotonic() + seconds):
+        yield
+
+
+async def retry_step(
+    step: str,
+    action: Callable[[], Awaitable[T]],
+    recover: Callable[[], Awaitable] | None = None,
+    cost: float = 0,
+    after: float = 0,
+    retries: int = 2,
+) -> T:
+    """
+    Run `action`, on a transient failure `recover` back to the last checkpoint and run it again
+
+    `cost` is the worst case duration of an attempt, `after` that of the steps still to come after this one.
+    """
+    deadline = current_deadline()
+    attempt = 0
+    while True:
+        try:
+            if attempt:
+                if recover is not None:
+                    await recover()
+                log.info("[%s] retry %s, %.1f s left", step, attempt, deadline.remaining)
+            return await action()
+        except RETRYABLE as e:
+            error = str(e).splitlines()[0] if str(e) else type(e).__name__
+            if attempt >= retries:
+                log.warning("[%s] failed after %s retries: %s", step, attempt, error)
+                raise
+            if not deadline.fits(cost + after):
+                log.warning(
+                    "[%s] failed with no time left for a retry (%.1f s left): %s", step, deadline.remaining, error
+                )
+                raise
+
+            attempt += 1
+            record("retry", 0, step=step, attempt=attempt, error=error)
+            log.warning("[%s] failed, recovering from the last checkpoint: %s", step, error)
@@ -0,0 +1,93 @@
+"""
+S3 storage layer for the calendar files.
+
+All transfers share one pooled client, run in worker threads so they don't block the event loop, are bounded in
+concurrency, retried with exponential backoff on transient errors and timed per object.
+"""
+
+import asyncio
+import functools
+import logging
+import random
+import time
+import weakref
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from src.tracing import record
+
+log = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = 8
+MAX_ATTEMPTS = 4
+BACKOFF_SECONDS = 0.2
+# Errors worth retrying, anything else (e.g. a missing key or denied access) fails right away
+RETRYABLE_CODES = {"RequestTimeout", "SlowDown", "Throttling", "ThrottlingException", "InternalError", "503", "500"}
+
+_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+
+@functools.cache
+def s3_client():
+    return boto3.client("s3", config=Config(max_pool_connections=MAX_CONCURRENCY, retries={"max_attempts": 1}))
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") in RETRYABLE_CODES
+    return isinstance(error, BotoCoreError)
+
+
+def is_missing(error: Exception) -> bool:
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404")
+
+
+def _limit() -> asyncio.Semaphore:
+    # One semaphore per event loop, a semaphore can't be shared between loops
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+
+async def _transfer(operation: str, key: str, call) -> tuple[object, int, float]:
+    async with _limit():
+        started = time.monotonic()
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                result = await asyncio.to_thread(call)
+                break
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS or not _is_retryable(e):
+                    log.error("%s of %s failed after %s attempts: %s", operation.capitalize(), key, attempt, e)
+                    raise
+                delay = BACKOFF_SECONDS * 2 ** (attempt - 1) * (1 + random.random())
+                log.warning("%s of %s failed (%s), retrying in %.2f s", operation.capitalize(), key, e, delay)
+                await asyncio.sleep(delay)
+
+        return result, attempt, time.monotonic() - started
+
+
+async def upload_bytes_to_s3(key, bytes, content_type, bucket, **extra):
+    client = s3_client()
+
+    def _upload():
+        client.put_object(Bucket=bucket, Key=key, Body=bytes, ContentType=content_type, **extra)
+
+    _, attempts, seconds = await _transfer("upload", key, _upload)
+    record("s3_upload", seconds, key=key, size=len(bytes), attempts=attempts)
+    log.info("File %s of type %s uploaded in %.0f ms (%s bytes).", key, content_type, seconds * 1000, len(bytes))
+
+
+async def load_bytes_from_s3(key, bucket) -> bytes:
+    client = s3_client()
+
+    def _download():
+        return client.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+    file_bytes, attempts, seconds = await _transfer("download", key, _download)
+    record("s3_download", seconds, key=key, size=len(file_bytes), attempts=attempts)
+    log.info("File %s downloaded in %.0f ms (%s bytes).", key, seconds * 1000, len(file_bytes))
+    return file_bytes
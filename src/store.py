@@ -0,0 +1,85 @@
+"""
+In-memory store of all reservations, past and future, from which every player view is derived.
+
+The history is loaded once per run from the monthly archive (see `src.archive`). Dates are parsed once per
+reservation and a player index maps every word of the player names to the reservations they play in, so adding a
+player view costs no extra S3 round trip and no extra parsing.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Sequence
+
+from src.archive import Index, load_history, save_history
+
+log = logging.getLogger(__name__)
+
+
+def reservation_key(reservation: dict) -> str:
+    return f"{reservation['datum']}-{reservation['begintijd']}-{reservation['baan']}"
+
+
+def parse_date(reservation: dict) -> date:
+    return datetime.strptime(reservation["datum"], "%d-%m-%Y").date()
+
+
+class ReservationStore:
+    def __init__(self, stored: list[dict], today: date | None = None):
+        self.today = today or datetime.now().date()
+        self.stored = stored
+        self.archive_index = Index()
+
+        stored_dates = [parse_date(reservation) for reservation in stored]
+        self.history = [reservation for reservation, day in zip(stored, stored_dates) if day < self.today]
+        self._history_dates = [day for day in stored_dates if day < self.today]
+        self.set_future([])
+
+    @classmethod
+    async def load(cls, bucket: str, prefix: str) -> "ReservationStore":
+        today = datetime.now().date()
+        index, stored = await load_history(bucket, prefix, today)
+        store = cls(stored, today)
+        store.archive_index = index
+        return store
+
+    async def save(self, bucket: str, prefix: str):
+        """Write the history partitions the current reservations can still change"""
+        await save_history(bucket, prefix, self.archive_index, self.reservations, self.today)
+
+    def known_players(self) -> dict[str, list[str]]:
+        return {
+            reservation_key(reservation): reservation["spelers"]
+            for reservation in self.stored
+            if reservation.get("spelers")
+        }
+
+    def set_future(self, future: list[dict]):
+        self.future = future
+        self.reservations = self.history + future
+        self.dates = self._history_dates + [parse_date(reservation) for reservation in future]
+
+        index = defaultdict(list)
+        for position, reservation in enumerate(self.reservations):
+            for word in {word for speler in reservation.get("spelers", []) for word in speler.lower().split()}:
+                index[word].append(position)
+        self.index = dict(index)
+
+    def positions(self, player: str | None = None) -> Sequence[int]:
+        return range(len(self.reservations)) if player is None else self.index.get(player, [])
+
+    def view(self, player: str | None = None) -> list[dict]:
+        positions = self.positions(player)
+        reservations = [self.reservations[position] for position in positions]
+
+        log.info(
+            "Combined %s previous and %s future reservations of %s",
+            sum(position < len(self.history) for position in positions),
+            sum(position >= len(self.history) for position in positions),
+            player or "all players",
+        )
+        return reservations
+
+    def dates_of(self, player: str | None = None) -> list[date]:
+        """The dates of the reservations of `view(player)`, in the same order"""
+        return [self.dates[position] for position in self.positions(player)]
@@ -0,0 +1,162 @@
+"""
+Lightweight tracing of a run: spans around its phases, published as one record in the dataset.
+
+A span times a block (`with span("select_date")`) or a coroutine function (`@traced()`), a measurement taken elsewhere
+is added with `record`. Spans nest along the task that opens them, so spans of concurrent tasks get the right parent.
+Outside a traced run all of them do nothing, which keeps the helpers usable from scripts and the benchmark.
+"""
+
+import functools
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+from apify import Actor
+
+log = logging.getLogger(__name__)
+
+# Time spent in these spans is waiting by design, it doesn't count towards the latency of the run
+WAITING_SPANS = {"sleep_until_prearm", "wait_for_release", "watch_for_cancellations"}
+
+
+@dataclass
+class Span:
+    name: str
+    parent: str | None
+    start_ms: float
+    ms: float
+    status: str = "ok"
+    attributes: dict = field(default_factory=dict)
+
+
+class Tracer:
+    def __init__(self, kind: str, **attributes):
+        self.kind = kind
+        self.attributes = attributes
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.monotonic()
+        self.spans: list[Span] = []
+        self.status = "running"
+        self.error: str | None = None
+
+    def add(self, name: str, started: float, seconds: float, status: str = "ok", **attributes):
+        self.spans.append(
+            Span(
+                name=name,
+                parent=_parent.get(),
+                start_ms=round((started - self.started) * 1000, 1),
+                ms=round(seconds * 1000, 1),
+                status=status,
+                attributes=attributes,
+            )
+        )
+
+    @property
+    def seconds(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def active_seconds(self) -> float:
+        """The duration of the run without the time it spent waiting on purpose"""
+        waiting = sum(
+            entry.ms for entry in self.spans if entry.name in WAITING_SPANS and entry.parent not in WAITING_SPANS
+        )
+        return self.seconds - waiting / 1000
+
+    def phases(self) -> dict[str, float]:
+        """Total milliseconds per span name"""
+        totals: dict[str, float] = {}
+        for entry in self.spans:
+            totals[entry.name] = round(totals.get(entry.name, 0) + entry.ms, 1)
+        return totals
+
+    def to_record(self) -> dict:
+        return {
+            "type": "trace",
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "started": self.started_at.isoformat(),
+            "seconds": round(self.seconds, 3),
+            "active_seconds": round(self.active_seconds, 3),
+            "attributes": self.attributes,
+            "phases": self.phases(),
+            "spans": [asdict(entry) for entry in self.spans],
+        }
+
+    def log_breakdown(self):
+        log.info("Run took %.0f ms, %.0f ms of it active", self.seconds * 1000, self.active_seconds * 1000)
+        for name, ms in sorted(self.phases().items(), key=lambda phase: -phase[1]):
+            log.info("%10.0f ms  %s", ms, name)
+
+
+_tracer: ContextVar[Tracer | None] = ContextVar("tracer", default=None)
+_parent: ContextVar[str | None] = ContextVar("parent", default=None)
+
+
+def current_tracer() -> Tracer | None:
+    return _tracer.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    tracer = _tracer.get()
+    if tracer is None:
+        yield
+        return
+
+    started = time.monotonic()
+    token = _parent.set(name)
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _parent.reset(token)
+        tracer.add(name, started, time.monotonic() - started, status, **attributes)
+
+
+def traced(name: str | None = None):
+    """Time every call of a coroutine function as a span, named after the function by default"""
+
+    def decorate(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with span(name or function.__name__):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def record(name: str, seconds: float, **attributes):
+    """Add a span for something that was timed elsewhere and just ended"""
+    tracer = _tracer.get()
+    if tracer is not None:
+        tracer.add(name, time.monotonic() - seconds, seconds, **attributes)
+
+
+@asynccontextmanager
+async def trace_run(kind: str, **attributes):
+    """Trace the run inside the block and push its timing breakdown to the dataset when it ends"""
+    tracer = Tracer(kind, **attributes)
+    token = _tracer.set(tracer)
+    try:
+        yield tracer
+        tracer.status = "ok"
+    except BaseException as e:
+        tracer.status, tracer.error = "error", str(e) or type(e).__name__
+        raise
+    finally:
+        _tracer.reset(token)
+        tracer.log_breakdown()
+        try:
+            await Actor.push_data(tracer.to_record())
+        except Exception:
+            log.exception("Publishing the trace failed")
@@ -1,4 +1,39 @@
 import re
+from html.parser import HTMLParser
+
+
+class _ClassTextParser(HTMLParser):
+    def __init__(self, tag: str, class_name: str):
+        super().__init__(convert_charrefs=True)
+        self.tag = tag
+        self.class_name = class_name
+        self.texts: list[str] = []
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._depth:
+            self._depth += tag == self.tag
+        elif tag == self.tag and self.class_name in (dict(attrs).get("class") or "").split():
+            self._depth = 1
+            self.texts.append("")
+
+    def handle_endtag(self, tag):
+        if self._depth and tag == self.tag:
+            self._depth -= 1
+            if not self._depth:
+                self.texts[-1] = self.texts[-1].strip()
+
+    def handle_data(self, data):
+        if self._depth:
+            self.texts[-1] += data
+
+
+def extract_texts(html: str, tag: str, class_name: str) -> list[str]:
+    # Text of every `tag` element with the given class, like `locator(f"{tag}.{class_name}").all_inner_texts()`
+    parser = _ClassTextParser(tag, class_name)
+    parser.feed(html)
+    parser.close()
+    return parser.texts
 
 
 def to_snake_case(s):
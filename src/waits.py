@@ -0,0 +1,54 @@
+"""
+Waiting layer for the browser flow: wait for the condition the next step depends on instead of sleeping.
+
+Every wait is bounded by the timeout of its step (see `Settings`) and reports how long it actually waited, so the
+booking path runs exactly as fast as the site responds.
+"""
+
+import logging
+import time
+from typing import Any, Literal
+
+from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from src.tracing import record
+
+log = logging.getLogger(__name__)
+
+
+class StepTimeout(Exception):
+    """Raised when a step didn't reach its condition within the timeout of the step"""
+
+
+def _report(step: str, condition: str, started: float) -> float:
+    waited = time.monotonic() - started
+    record("wait", waited, step=step, condition=condition)
+    log.debug("[%s] waited %.0f ms for %s", step, waited * 1000, condition)
+    return waited
+
+
+async def wait_for_selector(
+    page: Page,
+    selector: str,
+    step: str,
+    timeout: float,
+    state: Literal["attached", "detached", "visible", "hidden"] = "visible",
+) -> float:
+    started = time.monotonic()
+    try:
+        await page.wait_for_selector(selector, state=state, timeout=timeout * 1000)
+    except PlaywrightTimeoutError as e:
+        raise StepTimeout(f"[{step}] {selector} not {state} within {timeout} s") from e
+
+    return _report(step, f"{selector} ({state})", started)
+
+
+async def wait_for_function(page: Page, expression: str, step: str, timeout: float, arg: Any = None) -> float:
+    started = time.monotonic()
+    try:
+        await page.wait_for_function(expression, arg=arg, timeout=timeout * 1000)
+    except PlaywrightTimeoutError as e:
+        raise StepTimeout(f"[{step}] condition not met within {timeout} s") from e
+
+    return _report(step, "condition", started)
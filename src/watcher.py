@@ -0,0 +1,108 @@
+"""
+Watch mode: keep re-reading the matrix of the target date after the preferred slots turned out to be taken, and book
+as soon as a cancellation frees one up.
+
+The interval adapts: it is tight right after the matrix changed and in the run-up to the preferred times, backs off
+while nothing changes and is jittered so the polls don't fall into a fixed rhythm. Every poll is timed, a poll over its
+budget is abandoned and slow polls stretch the interval, so watching costs the club a small share of its capacity.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from src.matrix import Cell, Matrix, log_ranking, rank_cells
+from src.models import Input
+from src.tracing import traced
+
+log = logging.getLogger(__name__)
+
+# Each quiet poll stretches the interval by this factor
+BACKOFF_FACTOR = 1.5
+# Spread each interval by up to this fraction either way
+JITTER = 0.2
+# Wait at least this many times the duration of the last poll before polling again
+COST_RATIO = 20
+
+
+class WatchExpired(Exception):
+    """The watch ran out without booking a slot"""
+
+
+def freed_cells(previous: Matrix, current: Matrix) -> list[Cell]:
+    """The cells that are free now but weren't in the previous snapshot"""
+    before = previous.states()
+    return [cell for cell in current.cells if cell.state == "free" and before.get((cell.time, cell.column)) != "free"]
+
+
+def in_rush(args: Input, date: datetime, times: list[str], now: datetime | None = None) -> bool:
+    """Whether one of the preferred times starts within the rush window, when cancellations are most likely"""
+    now = now or datetime.now()
+    window = timedelta(minutes=args.watch_rush_minutes)
+    for slot_time in times:
+        hours, minutes = map(int, slot_time.split(":"))
+        start = date.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+        if timedelta(0) <= start - now <= window:
+            return True
+    return False
+
+
+def next_interval(args: Input, interval: float, changed: bool, rush: bool, cost: float) -> float:
+    if changed or rush:
+        interval = args.watch_min_interval
+    else:
+        interval = min(interval * BACKOFF_FACTOR, args.watch_max_interval)
+
+    return max(interval, cost * COST_RATIO)
+
+
+@traced()
+async def watch_for_cancellations(
+    args: Input,
+    date: datetime,
+    times: list[str],
+    poll: Callable[[], Awaitable[Matrix]],
+    book: Callable[[Matrix], Awaitable[bool]],
+) -> bool:
+    """Poll the matrix until a preferred slot frees up and is booked, or the watch runs out. Returns whether it booked"""
+    deadline = time.monotonic() + args.watch_minutes * 60
+    log.info("Watching %s for cancellations for %s minutes", date.strftime("%Y-%m-%d"), args.watch_minutes)
+
+    previous = await poll()
+    interval, polls, changes = args.watch_min_interval, 0, 0
+
+    while (remaining := deadline - time.monotonic()) > 0:
+        await asyncio.sleep(min(interval * random.uniform(1 - JITTER, 1 + JITTER), remaining))
+
+        started = time.monotonic()
+        try:
+            current = await asyncio.wait_for(poll(), timeout=args.watch_poll_budget)
+        except Exception as e:
+            cost = time.monotonic() - started
+            log.warning("Poll failed after %.0f ms: %s", cost * 1000, str(e) or type(e).__name__)
+            interval = next_interval(args, interval, changed=False, rush=False, cost=cost)
+            continue
+        finally:
+            polls += 1
+        cost = time.monotonic() - started
+
+        changed = current.states() != previous.states()
+        changes += changed
+        ranked = rank_cells(Matrix(date=current.date, cells=freed_cells(previous, current)), args, times)
+        previous = current
+
+        if ranked:
+            log.info("Cancellation spotted after %s polls", polls)
+            log_ranking(ranked)
+            if await book(current):
+                return True
+            log.info("Somebody else was faster, watching on")
+
+        interval = next_interval(args, interval, changed, in_rush(args, date, times), cost)
+        log.debug("Poll %s took %.0f ms, changed=%s, next in %.1f s", polls, cost * 1000, changed, interval)
+
+    log.info("Stopped watching after %s polls, the matrix changed %s times", polls, changes)
+    return False
@@ -0,0 +1,22 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from src.storage import s3_client
+
+BUCKET = "test-bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """An empty bucket in a local S3 stand-in"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "eu-west-1")
+    with mock_aws():
+        # The pooled client has to be created inside the mock
+        s3_client.cache_clear()
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": "eu-west-1"})
+        yield client
+    s3_client.cache_clear()
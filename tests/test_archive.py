@@ -0,0 +1,116 @@
+import asyncio
+import json
+from datetime import date
+
+import pytest
+
+from src import archive
+from src.archive import Index, decode_partition, index_key, load_history, partition_key, save_history, write_partitions
+
+BUCKET = "test-bucket"
+PREFIX = "calendar"
+
+
+def reservation(day: str, time: str = "20:30") -> dict:
+    return {"datum": day, "begintijd": time, "baan": "Court 3 Achterhal", "spelers": ["Jeroen Bos", "Vera Sweere"]}
+
+
+def keys(s3) -> set[str]:
+    return {item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET).get("Contents", [])}
+
+
+def test_write_partitions_writes_only_changed_months(s3):
+    index = Index()
+    reservations = [reservation("03-09-2026"), reservation("17-09-2026"), reservation("05-10-2026")]
+
+    assert asyncio.run(write_partitions(BUCKET, PREFIX, index, reservations, {"2026-09", "2026-10"}))
+    assert keys(s3) == {partition_key(PREFIX, "2026-09"), partition_key(PREFIX, "2026-10")}
+    assert index.partitions["2026-09"]["count"] == 2
+
+    body = s3.get_object(Bucket=BUCKET, Key=partition_key(PREFIX, "2026-09"))["Body"].read()
+    assert decode_partition(body) == reservations[:2]
+
+    # Writing the same reservations again changes nothing
+    s3.delete_object(Bucket=BUCKET, Key=partition_key(PREFIX, "2026-09"))
+    assert not asyncio.run(write_partitions(BUCKET, PREFIX, index, reservations, {"2026-09", "2026-10"}))
+    assert keys(s3) == {partition_key(PREFIX, "2026-10")}
+
+
+def test_write_partitions_skips_new_empty_months(s3):
+    index = Index()
+
+    assert not asyncio.run(write_partitions(BUCKET, PREFIX, index, [], {"2026-11"}))
+    assert index.partitions == {}
+
+
+def test_save_history_leaves_sealed_months_alone(s3):
+    index = Index()
+    september, october = reservation("17-09-2026"), reservation("05-10-2026")
+    asyncio.run(write_partitions(BUCKET, PREFIX, index, [september], {"2026-09"}))
+    sealed = s3.get_object(Bucket=BUCKET, Key=partition_key(PREFIX, "2026-09"))["ETag"]
+
+    # A sealed month left out of the reservations isn't emptied
+    asyncio.run(save_history(BUCKET, PREFIX, index, [october], date(2026, 10, 17)))
+
+    assert s3.get_object(Bucket=BUCKET, Key=partition_key(PREFIX, "2026-09"))["ETag"] == sealed
+    stored = Index.from_bytes(s3.get_object(Bucket=BUCKET, Key=index_key(PREFIX))["Body"].read())
+    assert set(stored.partitions) == {"2026-09", "2026-10"}
+
+
+def test_save_history_writes_nothing_when_unchanged(s3):
+    index = Index()
+    reservations = [reservation("05-10-2026")]
+    asyncio.run(save_history(BUCKET, PREFIX, index, reservations, date(2026, 10, 17)))
+    s3.delete_object(Bucket=BUCKET, Key=index_key(PREFIX))
+
+    asyncio.run(save_history(BUCKET, PREFIX, index, reservations, date(2026, 10, 17)))
+
+    assert index_key(PREFIX) not in keys(s3)
+
+
+def test_save_history_empties_a_month_whose_reservation_was_cancelled(s3):
+    index = Index()
+    asyncio.run(save_history(BUCKET, PREFIX, index, [reservation("05-11-2026")], date(2026, 10, 17)))
+
+    asyncio.run(save_history(BUCKET, PREFIX, index, [], date(2026, 10, 17)))
+
+    body = s3.get_object(Bucket=BUCKET, Key=partition_key(PREFIX, "2026-11"))["Body"].read()
+    assert decode_partition(body) == []
+    assert index.partitions["2026-11"]["count"] == 0
+
+
+def test_load_history_migrates_and_round_trips(s3):
+    legacy = [reservation(f"{day:02d}-{month:02d}-2026") for month in (8, 9, 10) for day in (3, 17)]
+    s3.put_object(Bucket=BUCKET, Key=f"{PREFIX}/reservations.json", Body=json.dumps(legacy))
+
+    index, loaded = asyncio.run(load_history(BUCKET, PREFIX, date(2026, 10, 17)))
+    assert loaded == legacy
+    assert index.sealed_through == "2026-09"
+
+    asyncio.run(save_history(BUCKET, PREFIX, index, loaded, date(2026, 10, 17)))
+    _, reloaded = asyncio.run(load_history(BUCKET, PREFIX, date(2026, 10, 18)))
+    assert reloaded == legacy
+
+
+def test_load_history_seals_a_month_once_when_the_index_upload_fails(s3, monkeypatch):
+    legacy = [reservation(f"{day:02d}-{month:02d}-2026") for month in (8, 9, 10) for day in (3, 17)]
+    s3.put_object(Bucket=BUCKET, Key=f"{PREFIX}/reservations.json", Body=json.dumps(legacy))
+    asyncio.run(load_history(BUCKET, PREFIX, date(2026, 10, 17)))
+
+    upload = archive.upload_bytes_to_s3
+
+    async def fail_on_the_index(key, *args, **kwargs):
+        if key == index_key(PREFIX):
+            raise Exception("Upload failed")
+        await upload(key, *args, **kwargs)
+
+    # October gets sealed into the snapshot, but the index isn't updated
+    monkeypatch.setattr(archive, "upload_bytes_to_s3", fail_on_the_index)
+    with pytest.raises(Exception, match="Upload failed"):
+        asyncio.run(load_history(BUCKET, PREFIX, date(2026, 11, 2)))
+    monkeypatch.setattr(archive, "upload_bytes_to_s3", upload)
+
+    index, loaded = asyncio.run(load_history(BUCKET, PREFIX, date(2026, 11, 2)))
+
+    assert loaded == legacy
+    assert index.sealed_through == "2026-10"
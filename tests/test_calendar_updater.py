@@ -0,0 +1,140 @@
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+
+from icalendar import Event
+
+from src.calendar_updater import generate_placeholders, generate_upload_files, render_event, stamp_event
+from src.manifest import Manifest
+from src.models import CalendarView, Settings
+from src.store import ReservationStore
+
+BUCKET = "test-bucket"
+RESERVATION = {
+    "datum": "05-10-2026",
+    "begintijd": "20:30",
+    "baan": "Court 3 Achterhal",
+    "spelers": ["Jeroen Bos", "Vera Sweere"],
+}
+URL = "https://squtrecht.baanreserveren.nl/user/reservations"
+
+
+def make_store() -> ReservationStore:
+    today = date.today()
+    store = ReservationStore(
+        [
+            {
+                "datum": (today - timedelta(days=day)).strftime("%d-%m-%Y"),
+                "begintijd": "20:30",
+                "baan": "Court 3 Achterhal",
+                "spelers": ["Jeroen Bos", "Vera Sweere"],
+            }
+            for day in (3, 10, 100)
+        ],
+        today,
+    )
+    store.set_future(
+        [
+            {
+                "datum": (today + timedelta(days=2)).strftime("%d-%m-%Y"),
+                "begintijd": "19:45",
+                "baan": "Court 4 Achterhal",
+                "spelers": ["Jeroen Bos", "Koen"],
+            }
+        ]
+    )
+    return store
+
+
+def test_generate_upload_files_skips_unchanged_files(s3):
+    settings = Settings(calendar_bucket=BUCKET, calendar_prefix="calendar")
+    store, view = make_store(), CalendarView(player="jeroen")
+
+    def upload(manifest: Manifest) -> Manifest:
+        asyncio.run(generate_upload_files(settings, store, view, manifest, ["MO 20:30"], window_days=60))
+        return manifest
+
+    first = upload(Manifest())
+    keys = {item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET)["Contents"]}
+    assert (
+        keys
+        == set(first.uploaded)
+        == {
+            "calendar/reservations-jeroen.json",
+            "calendar/reservations_placeholders-jeroen.json",
+            "calendar/reservations-jeroen.ics",
+            "calendar/reservations-jeroen-recent.ics",
+        }
+    )
+
+    # Only the feeds are compressed, the data files keep their plain format
+    feed = s3.get_object(Bucket=BUCKET, Key="calendar/reservations-jeroen.ics")
+    assert feed["ContentEncoding"] == "gzip"
+    assert feed["CacheControl"] == "public, max-age=300, must-revalidate"
+    data = s3.get_object(Bucket=BUCKET, Key="calendar/reservations-jeroen.json")
+    assert "ContentEncoding" not in data
+    assert json.loads(data["Body"].read())[0]["begintijd"] == "20:30"
+
+    # The next run starts from the stored manifest and renders the same bytes
+    for key in keys:
+        s3.delete_object(Bucket=BUCKET, Key=key)
+    second = upload(Manifest.from_bytes(first.to_bytes()))
+
+    assert second.uploaded == []
+    assert not second.changed
+    assert sorted(second.skipped) == sorted(keys)
+    assert second.bytes_saved == first.bytes_uploaded
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)
+
+
+def test_stamp_event_matches_icalendar():
+    uid, event = render_event(json.dumps(RESERVATION), URL)
+    dtstamp = datetime(2026, 10, 17, 12, 30, tzinfo=timezone.utc)
+
+    expected = Event.from_ical(event)
+    expected.add("dtstamp", dtstamp)
+    expected.add("sequence", 20261017)
+
+    stamped = stamp_event(event, dtstamp, 20261017)
+
+    assert stamped == expected.to_ical()
+    parsed = Event.from_ical(stamped)
+    assert str(parsed["uid"]) == uid
+    assert parsed.decoded("dtstamp") == dtstamp
+    assert parsed.decoded("sequence") == 20261017
+
+
+def test_stamp_event_handles_a_folded_uid():
+    placeholder = {**RESERVATION, "weekdag": "Woensdag" * 10, "rrule": "FREQ=WEEKLY;COUNT=8", "exdate": []}
+    uid, event = render_event(json.dumps(placeholder), URL)
+    assert b"\r\n " in event.split(b"UID:")[1].split(b"\r\nSTATUS")[0]
+
+    parsed = Event.from_ical(stamp_event(event, datetime(2026, 10, 17, tzinfo=timezone.utc), 3))
+
+    assert str(parsed["uid"]) == uid
+    assert parsed.decoded("sequence") == 3
+
+
+def test_generate_placeholders_describes_each_weekly_session_once():
+    # A Monday, the placeholders run into winter time
+    start = datetime(2026, 10, 19, 9, 0)
+
+    monday, wednesday = generate_placeholders(start, 8, ["MO 20:30", "WE 20:30"], booked={date(2026, 10, 26)})
+
+    assert monday["datum"] == "19-10-2026"
+    assert monday["begintijd"] == "20:30"
+    # The last Monday is 7 December, 20:30 in Amsterdam is 19:30 UTC in winter
+    assert monday["rrule"] == "FREQ=WEEKLY;BYDAY=MO;UNTIL=20261207T193000Z"
+    assert monday["exdate"] == ["26-10-2026"]
+    assert wednesday["datum"] == "21-10-2026"
+    assert wednesday["exdate"] == []
+
+
+def test_generate_placeholders_size_does_not_grow_with_the_weeks():
+    start = datetime(2026, 10, 19, 9, 0)
+
+    few = generate_placeholders(start, 8, ["MO 20:30"])
+    many = generate_placeholders(start, 200, ["MO 20:30"])
+
+    assert len(json.dumps(few)) == len(json.dumps(many))
+    assert many[0]["rrule"].endswith("UNTIL=20300812T183000Z")
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.http_engine import create_client, fetch_matrix, http_book_slot, http_login, racer_clients
+from src.mock_site import COURTS, MockSite, slot_id
+from src.models import Input, Settings
+
+DATE = datetime.combine(datetime.today() + timedelta(days=7), datetime.min.time())
+
+
+@pytest.fixture
+def site():
+    with MockSite(occupancy=0) as site:
+        yield site
+
+
+def book(site: MockSite, args: Input, dry_run: bool = False) -> bool:
+    settings = Settings(
+        username="jeroen@example.com",
+        password="secret",
+        session_cache="off",
+        base_url=site.base_url,
+        dry_run=dry_run,
+    )
+
+    async def run() -> bool:
+        async with create_client(settings) as client:
+            await http_login(settings, client)
+            matrix = await fetch_matrix(client, DATE)
+            async with racer_clients(settings, args, client) as racers:
+                return await http_book_slot(settings, args, client, matrix, racers=racers)
+
+    return asyncio.run(run())
+
+
+def booked(site: MockSite) -> list[tuple[str, str]]:
+    return [(reservation["begintijd"], reservation["baan"]) for reservation in site.reservations]
+
+
+def test_books_the_best_ranked_slot(site):
+    assert book(site, Input(dry_run=False, times=["20:30", "19:45"], opponent="vera"))
+
+    assert booked(site) == [("20:30", COURTS["4"])]
+    assert site.reservations[0]["spelers"][-1] == "Vera Sweere"
+
+
+def test_skips_taken_and_excluded_slots(site):
+    site.taken[("4", slot_id(DATE, "20:30"))] = True
+    site.taken[("3", slot_id(DATE, "20:30"))] = True
+
+    assert book(site, Input(dry_run=False, times=["20:30", "19:45"]))
+
+    assert booked(site) == [("20:30", COURTS["2"])]
+
+
+def test_tries_the_next_slot_when_one_is_taken_at_the_final_submit(site):
+    grabbed = ("4", slot_id(DATE, "20:30"))
+    steps = []
+    contend = site.contend
+
+    def grab_at_the_final_submit(resource: str, slot: str):
+        steps.append((resource, slot))
+        if steps.count(grabbed) == 2:
+            site.taken[grabbed] = True
+        contend(resource, slot)
+
+    site.contend = grab_at_the_final_submit
+
+    assert book(site, Input(dry_run=False, times=["20:30"]))
+
+    assert booked(site) == [("20:30", COURTS["3"])]
+
+
+def test_returns_false_when_no_preferred_slot_is_free(site):
+    for resource in COURTS:
+        site.taken[(resource, slot_id(DATE, "20:30"))] = True
+
+    assert not book(site, Input(dry_run=False, times=["20:30"]))
+    assert site.reservations == []
+
+
+def test_dry_run_books_nothing(site):
+    assert book(site, Input(times=["20:30"]), dry_run=True)
+
+    assert site.reservations == []
+
+
+def test_races_with_a_session_per_racer(site):
+    site.taken[("4", slot_id(DATE, "20:30"))] = True
+
+    assert book(site, Input(dry_run=False, times=["20:30", "19:45"], race_concurrency=3))
+
+    assert booked(site) == [("20:30", COURTS["3"])]
+    assert len(site.sessions) == 3
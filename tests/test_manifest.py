@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+from src.manifest import Manifest
+
+
+def test_event_stamp_starts_above_the_date_sequence():
+    manifest = Manifest()
+
+    dtstamp, sequence = manifest.event_stamp("feed", "uid", "content")
+
+    today = datetime.now(timezone.utc)
+    assert sequence == int(today.strftime("%Y%m%d"))
+    assert dtstamp.date() == today.date()
+
+
+def test_event_stamp_is_kept_while_the_content_is_unchanged():
+    manifest = Manifest()
+    first = manifest.event_stamp("feed", "uid", "content")
+
+    # Also across runs, through the stored manifest
+    manifest = Manifest.from_bytes(manifest.to_bytes())
+
+    assert manifest.event_stamp("feed", "uid", "content") == first
+
+
+def test_event_stamp_bumps_the_sequence_when_the_content_changes():
+    manifest = Manifest()
+    _, sequence = manifest.event_stamp("feed", "uid", "content")
+
+    dtstamp, changed = manifest.event_stamp("feed", "uid", "other content")
+
+    assert changed == sequence + 1
+    assert manifest.event_stamp("feed", "uid", "other content") == (dtstamp, changed)
+
+
+def test_event_stamps_are_per_feed_and_pruned():
+    manifest = Manifest()
+    manifest.event_stamp("feed", "uid", "content")
+    manifest.event_stamp("feed", "gone", "content")
+    manifest.event_stamp("other", "uid", "content")
+
+    manifest.prune_events("feed", {"uid"})
+
+    assert set(manifest.events["feed"]) == {"uid"}
+    assert set(manifest.events["other"]) == {"uid"}
+
+
+def test_is_unchanged_compares_content_and_headers():
+    manifest = Manifest()
+    headers = {"ContentEncoding": "gzip", "CacheControl": "public, max-age=300"}
+    manifest.record_upload("key", b"content", headers)
+
+    # Also across runs, through the stored manifest
+    manifest = Manifest.from_bytes(manifest.to_bytes())
+
+    assert manifest.is_unchanged("key", b"content", dict(headers))
+    assert not manifest.is_unchanged("key", b"other", headers)
+    assert not manifest.is_unchanged("key", b"content", {**headers, "CacheControl": "no-cache"})
+    assert not manifest.is_unchanged("key", b"content")
+    assert not manifest.is_unchanged("other", b"content", headers)
@@ -0,0 +1,86 @@
+from src.matrix import Cell, Matrix, parse_matrix_html, rank_cells
+from src.models import Input
+
+COURTS = ["Court 1 Voorhal", "Court 2 Voorhal", "Court 3 Achterhal", "Court 10 Achterhal"]
+
+
+def make_matrix(states: dict[str, list[str]]) -> Matrix:
+    return Matrix(
+        date=None,
+        cells=[
+            Cell(time=time, column=column, court=COURTS[column], state=state, resource=str(column + 1), slot=time)
+            for time, row in states.items()
+            for column, state in enumerate(row)
+        ],
+    )
+
+
+def describe(ranked) -> list[tuple[str, str]]:
+    return [(ranked_cell.cell.time, ranked_cell.cell.court) for ranked_cell in ranked]
+
+
+def test_rank_cells_orders_by_time_then_back_hall_for_members():
+    matrix = make_matrix(
+        {
+            "19:45": ["free", "free", "free", "free"],
+            "20:30": ["free", "free", "taken", "free"],
+        }
+    )
+
+    ranked = rank_cells(matrix, Input(leden_only=True), ["20:30", "19:45"])
+
+    assert describe(ranked) == [
+        ("20:30", "Court 10 Achterhal"),
+        ("20:30", "Court 2 Voorhal"),
+        ("19:45", "Court 10 Achterhal"),
+        ("19:45", "Court 3 Achterhal"),
+        ("19:45", "Court 2 Voorhal"),
+    ]
+
+
+def test_rank_cells_orders_front_hall_first_for_everyone():
+    matrix = make_matrix({"20:15": ["free", "free", "free", "taken"]})
+
+    ranked = rank_cells(matrix, Input(leden_only=False), ["20:15"])
+
+    assert describe(ranked) == [("20:15", "Court 2 Voorhal"), ("20:15", "Court 3 Achterhal")]
+
+
+def test_rank_cells_skips_other_times_and_states():
+    matrix = make_matrix(
+        {
+            "19:00": ["free", "free", "free", "free"],
+            "20:30": ["taken", "closed", "taken", "taken"],
+        }
+    )
+
+    assert rank_cells(matrix, Input(), ["20:30"]) == []
+    assert describe(rank_cells(matrix, Input(), ["20:30"], states=("free", "closed"))) == [("20:30", "Court 2 Voorhal")]
+
+
+def test_rank_cells_only_excludes_the_named_court():
+    matrix = make_matrix({"20:30": ["free", "taken", "taken", "free"]})
+
+    ranked = rank_cells(matrix, Input(excluded_courts=["Court 1 "]), ["20:30"])
+
+    assert describe(ranked) == [("20:30", "Court 10 Achterhal")]
+
+
+def test_parse_matrix_html_takes_the_courts_of_the_matrix_table_only():
+    html = (
+        "<table><tr><th>Naam</th><th>Tijd</th></tr><tr><td>Jeroen</td><td>20:30</td></tr></table>"
+        '<div id="matrix_date_title">Maandag 05-10-2026</div>'
+        '<table id="matrix"><thead><tr><th></th><th class="r-2">Court 2 Voorhal</th><th>Court 3 Achterhal</th></tr>'
+        "</thead><tbody>"
+        '<tr data-time="20:30"><th>20:30</th><td class="r-2" slot="1" type="free"></td><td type="taken"></td></tr>'
+        "</tbody></table>"
+        "<table><tr><th>Legenda</th></tr></table>"
+    )
+
+    matrix = parse_matrix_html(html)
+
+    assert matrix.date.strftime("%Y-%m-%d") == "2026-10-05"
+    assert [(cell.court, cell.state, cell.resource) for cell in matrix.cells] == [
+        ("Court 2 Voorhal", "free", "2"),
+        ("Court 3 Achterhal", "taken", None),
+    ]
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from src.racing import Candidate, Race, run_race
+
+
+def candidates(count: int) -> list[Candidate]:
+    return [Candidate(time="20:30", rank=rank) for rank in range(count)]
+
+
+def test_run_race_commits_exactly_one_and_cancels_the_losers():
+    committed, cancelled = [], []
+
+    async def attempt(candidate: Candidate, race: Race) -> bool:
+        try:
+            # The lower ranked candidates reach the confirmation step first
+            await asyncio.sleep(0.01 * (3 - candidate.rank))
+            if not race.claim(candidate):
+                return False
+            committed.append(candidate.rank)
+            return True
+        except asyncio.CancelledError:
+            cancelled.append(candidate.rank)
+            raise
+
+    async def slow_attempt(candidate: Candidate, race: Race) -> bool:
+        if candidate.rank == 3:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(candidate.rank)
+                raise
+        return await attempt(candidate, race)
+
+    winner = asyncio.run(run_race(candidates(4), slow_attempt, concurrency=4))
+
+    assert winner.rank == 2
+    assert committed == [2]
+    assert sorted(cancelled) == [0, 1, 3]
+
+
+def test_run_race_claims_once_when_attempts_reach_the_confirmation_together():
+    claims = []
+
+    async def attempt(candidate: Candidate, race: Race) -> bool:
+        await asyncio.sleep(0)
+        claims.append(race.claim(candidate))
+        # The final submit of the winner still takes a while
+        await asyncio.sleep(0.01)
+        return claims[-1]
+
+    winner = asyncio.run(run_race(candidates(3), attempt, concurrency=3))
+
+    assert winner.rank == 0
+    assert claims.count(True) == 1
+
+
+def test_run_race_moves_on_from_failed_attempts():
+    async def attempt(candidate: Candidate, race: Race) -> bool:
+        if candidate.rank < 2:
+            raise Exception("Slot taken")
+        return race.claim(candidate)
+
+    assert asyncio.run(run_race(candidates(3), attempt, concurrency=1)).rank == 2
+
+
+def test_run_race_respects_the_concurrency():
+    running, peak = 0, 0
+
+    async def attempt(candidate: Candidate, race: Race) -> bool:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return False
+
+    assert asyncio.run(run_race(candidates(6), attempt, concurrency=2)) is None
+    assert peak == 2
+
+
+def test_run_race_raises_the_failure_of_the_winner():
+    started = []
+
+    async def attempt(candidate: Candidate, race: Race) -> bool:
+        started.append(candidate.rank)
+        if candidate.rank == 0:
+            race.claim(candidate)
+            raise Exception("Final submit failed")
+        await asyncio.sleep(10)
+        return race.claim(candidate)
+
+    with pytest.raises(Exception, match="Final submit failed"):
+        asyncio.run(run_race(candidates(3), attempt, concurrency=1))
+    # No other candidate was tried after the final submit may have been sent
+    assert started == [0]
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from src import scheduler
+from src.models import Account, Club, Input, Registry, ScheduledJob, Settings
+
+
+class FakeContext:
+    async def route(self, url, handler):
+        pass
+
+    async def new_page(self):
+        return None
+
+    async def close(self):
+        pass
+
+
+class FakeBrowser:
+    async def new_context(self, **options):
+        return FakeContext()
+
+    async def close(self):
+        pass
+
+
+class FakePlaywright:
+    devices = {scheduler.DEVICE: {}}
+
+    class chromium:
+        @staticmethod
+        async def launch(**options):
+            return FakeBrowser()
+
+
+def make_registry() -> Registry:
+    return Registry(
+        clubs={"utrecht": Club(base_url="http://127.0.0.1:1")},
+        accounts={
+            "jeroen": Account(club="utrecht", username="jeroen", password="secret"),
+            "vera": Account(club="utrecht", username="vera", password_env="VERA_PASSWORD"),
+        },
+        jobs=[
+            ScheduledJob(account="vera", input=Input(update_calendar=True)),
+            ScheduledJob(account="jeroen", input=Input(update_calendar=True)),
+        ],
+    )
+
+
+def test_account_settings_names_a_missing_password_variable(monkeypatch):
+    monkeypatch.delenv("VERA_PASSWORD", raising=False)
+
+    with pytest.raises(ValueError, match="VERA_PASSWORD"):
+        scheduler.account_settings(Settings(), make_registry(), "vera")
+
+    monkeypatch.setenv("VERA_PASSWORD", "secret")
+    assert scheduler.account_settings(Settings(), make_registry(), "vera").password == "secret"
+
+
+def test_missing_credentials_only_fail_the_jobs_of_their_account(monkeypatch):
+    monkeypatch.delenv("VERA_PASSWORD", raising=False)
+    ran, pushed = [], []
+
+    async def run_scheduled_job(settings, name, club, job, page):
+        ran.append(name)
+        return scheduler.ScheduledResult(name, club, scheduler.job_kind(job), "done", 0)
+
+    async def push_data(data):
+        pushed.append(data)
+
+    async def load_session(settings):
+        return None
+
+    monkeypatch.setattr(scheduler, "run_scheduled_job", run_scheduled_job)
+    monkeypatch.setattr(scheduler, "load_session", load_session)
+    monkeypatch.setattr(scheduler.Actor, "push_data", push_data)
+
+    with pytest.raises(Exception, match="Failed jobs: calendar of vera"):
+        asyncio.run(scheduler.run_scheduler(Settings(session_cache="off"), make_registry(), FakePlaywright()))
+
+    assert ran == ["jeroen"]
+    assert {(result["account"], result["status"]) for result in pushed} == {("vera", "failed"), ("jeroen", "done")}
@@ -0,0 +1,107 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from http import HTTPStatus
+
+import pytest
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import async_playwright
+
+from src.mock_site import MockSite
+from src.models import Settings
+from src.standby import Standby
+
+
+def http_request(method: str, path: str, body: bytes = b"", token: str | None = None) -> bytes:
+    headers = f"Content-Length: {len(body)}\r\n"
+    if token is not None:
+        headers += f"Authorization: Bearer {token}\r\n"
+    return f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n".encode() + body
+
+
+async def respond(standby: Standby, request: bytes) -> tuple[HTTPStatus, dict]:
+    reader = asyncio.StreamReader()
+    reader.feed_data(request)
+    reader.feed_eof()
+    return await standby.respond(reader)
+
+
+def call(standby: Standby, request: bytes) -> tuple[HTTPStatus, dict]:
+    return asyncio.run(respond(standby, request))
+
+
+@pytest.fixture
+def cold_standby() -> Standby:
+    # Enough to answer requests that never reach the browser
+    return Standby(Settings(username="jeroen@example.com", password="secret", standby_token="token"), None)
+
+
+def test_rejects_requests_without_the_token(cold_standby):
+    assert call(cold_standby, http_request("GET", "/health"))[0] == HTTPStatus.UNAUTHORIZED
+    assert call(cold_standby, http_request("GET", "/health", token="wrong"))[0] == HTTPStatus.UNAUTHORIZED
+
+
+def test_health_reports_a_missing_browser(cold_standby):
+    status, body = call(cold_standby, http_request("GET", "/health", token="token"))
+
+    assert status == HTTPStatus.SERVICE_UNAVAILABLE
+    assert body["status"] == "browser down"
+    assert body["jobs_running"] == 0
+
+
+@pytest.mark.parametrize(
+    "method, path, expected",
+    [
+        ("GET", "/unknown", HTTPStatus.NOT_FOUND),
+        ("POST", "/health", HTTPStatus.METHOD_NOT_ALLOWED),
+        ("GET", "/book", HTTPStatus.METHOD_NOT_ALLOWED),
+        ("DELETE", "/calendar", HTTPStatus.METHOD_NOT_ALLOWED),
+    ],
+)
+def test_rejects_unknown_paths_and_methods(cold_standby, method, path, expected):
+    assert call(cold_standby, http_request(method, path, token="token"))[0] == expected
+
+
+@pytest.mark.parametrize("body", [b"{not json", b'{"race_concurrency": "many"}'])
+def test_rejects_a_bad_body(cold_standby, body):
+    status, response = call(cold_standby, http_request("POST", "/book", body, token="token"))
+
+    assert status == HTTPStatus.BAD_REQUEST
+    assert response["error"]
+
+
+def test_rejects_a_malformed_request(cold_standby):
+    assert call(cold_standby, b"GET\r\n\r\n")[0] == HTTPStatus.BAD_REQUEST
+
+
+def test_books_a_dry_run_against_the_stand_in_site():
+    async def run(site: MockSite) -> list[tuple[HTTPStatus, dict]]:
+        settings = Settings(
+            username="jeroen@example.com", password="secret", session_cache="off", base_url=site.base_url
+        )
+        async with async_playwright() as playwright:
+            standby = Standby(settings, playwright)
+            try:
+                await standby.launch()
+            except PlaywrightError as e:
+                pytest.skip(f"No browser to stand by with: {str(e).splitlines()[0]}")
+            try:
+                body = json.dumps(
+                    {"reservation_date": (datetime.today() + timedelta(days=7)).strftime("%Y-%m-%d")}
+                ).encode()
+                return [
+                    await respond(standby, http_request("POST", "/book", body)),
+                    await respond(standby, http_request("GET", "/health")),
+                ]
+            finally:
+                await standby.close()
+
+    with MockSite(occupancy=0.5) as site:
+        (status, result), (health, state) = asyncio.run(run(site))
+
+    assert status == HTTPStatus.OK, result
+    assert result["kind"] == "booking" and result["status"] == "done"
+    assert health == HTTPStatus.OK
+    assert state["jobs_done"] == 1
+    # A dry run stops before the final submit
+    assert site.reservations == []
@@ -0,0 +1,108 @@
+import asyncio
+import math
+
+import pytest
+
+from src.baanreserveren import booking_step
+from src.models import Settings
+from src.steps import current_deadline, deadline_after, retry_step
+from src.waits import StepTimeout
+
+
+class Flaky:
+    """An action failing with `error` the first `failures` attempts, and the recoveries run in between"""
+
+    def __init__(self, failures: int, error: Exception | None = None):
+        self.failures = failures
+        self.error = error or StepTimeout("[slot] not visible")
+        self.attempts = 0
+        self.recoveries = 0
+
+    async def action(self) -> str:
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise self.error
+        return "done"
+
+    async def recover(self):
+        self.recoveries += 1
+
+
+def test_no_deadline_outside_a_run():
+    assert current_deadline().remaining == math.inf
+    with deadline_after(5):
+        assert 4 < current_deadline().remaining <= 5
+    assert current_deadline().remaining == math.inf
+
+
+def test_retry_step_recovers_and_retries_transient_failures():
+    flaky = Flaky(failures=2)
+
+    assert asyncio.run(retry_step("slot", flaky.action, flaky.recover, retries=2)) == "done"
+    assert (flaky.attempts, flaky.recoveries) == (3, 2)
+
+
+def test_retry_step_gives_up_after_the_last_retry():
+    flaky = Flaky(failures=3)
+
+    with pytest.raises(StepTimeout):
+        asyncio.run(retry_step("slot", flaky.action, flaky.recover, retries=2))
+    assert (flaky.attempts, flaky.recoveries) == (3, 2)
+
+
+def test_retry_step_passes_other_errors_straight_through():
+    flaky = Flaky(failures=1, error=ValueError("Requested date is in the past"))
+
+    with pytest.raises(ValueError):
+        asyncio.run(retry_step("date", flaky.action, flaky.recover, retries=2))
+    assert (flaky.attempts, flaky.recoveries) == (1, 0)
+
+
+def test_retry_step_gives_up_when_the_retry_no_longer_fits():
+    flaky = Flaky(failures=1)
+
+    async def run():
+        with deadline_after(10):
+            return await retry_step("slot", flaky.action, flaky.recover, cost=5, after=6)
+
+    with pytest.raises(StepTimeout):
+        asyncio.run(run())
+    assert (flaky.attempts, flaky.recoveries) == (1, 0)
+
+
+def test_retry_step_retries_while_the_retry_fits():
+    flaky = Flaky(failures=1)
+
+    async def run():
+        with deadline_after(12):
+            return await retry_step("slot", flaky.action, flaky.recover, cost=5, after=6)
+
+    assert asyncio.run(run()) == "done"
+    assert (flaky.attempts, flaky.recoveries) == (2, 1)
+
+
+@pytest.mark.parametrize(
+    "step, seconds, retried",
+    [
+        # The slot takes 5 s at worst, the confirm and commit steps after it 10 s each
+        ("slot", 24, False),
+        ("slot", 26, True),
+        # Nothing comes after the commit
+        ("commit", 9, False),
+        ("commit", 11, True),
+    ],
+)
+def test_booking_step_keeps_room_for_the_steps_after_it(step, seconds, retried):
+    settings = Settings(login_timeout=10, date_timeout=10, slot_timeout=5, submit_timeout=10, step_retries=2)
+    flaky = Flaky(failures=1)
+
+    async def run():
+        with deadline_after(seconds):
+            return await booking_step(settings, step, flaky.action, flaky.recover)
+
+    if retried:
+        assert asyncio.run(run()) == "done"
+    else:
+        with pytest.raises(StepTimeout):
+            asyncio.run(run())
+    assert flaky.attempts == (2 if retried else 1)
@@ -0,0 +1,23 @@
+from datetime import date
+
+from src.store import ReservationStore
+
+
+def reservation(day: str, *spelers: str) -> dict:
+    return {"datum": day, "begintijd": "20:30", "baan": "Court 3 Achterhal", "spelers": list(spelers)}
+
+
+def test_views_and_their_dates_follow_the_player_index():
+    past = reservation("05-10-2026", "Jeroen Bos", "Vera Sweere")
+    stale = reservation("20-10-2026", "Jeroen Bos", "Koen")
+    store = ReservationStore([past, stale], today=date(2026, 10, 17))
+    future = reservation("19-10-2026", "Jeroen Bos", "Koen")
+
+    store.set_future([future])
+
+    # Stored reservations from today on are replaced by the scraped future ones
+    assert store.view() == [past, future]
+    assert store.dates_of() == [date(2026, 10, 5), date(2026, 10, 19)]
+    assert store.view("vera") == [past]
+    assert store.dates_of("koen") == [date(2026, 10, 19)]
+    assert store.view("nobody") == store.dates_of("nobody") == []
@@ -0,0 +1,46 @@
+from src.matrix import Cell, Matrix
+from src.models import Input
+from src.watcher import BACKOFF_FACTOR, COST_RATIO, freed_cells, next_interval
+
+
+def make_matrix(states: list[str | None]) -> Matrix:
+    return Matrix(
+        date=None,
+        cells=[
+            Cell(time="20:30", column=column, court=f"Court {column + 1}", state=state, resource=None, slot=None)
+            for column, state in enumerate(states)
+        ],
+    )
+
+
+def test_freed_cells_are_free_now_and_not_before():
+    previous = make_matrix(["taken", "free", "taken", None])
+    current = make_matrix(["free", "free", "taken", "free"])
+
+    assert [cell.court for cell in freed_cells(previous, current)] == ["Court 1", "Court 4"]
+
+
+def test_freed_cells_of_an_unchanged_matrix_are_none():
+    matrix = make_matrix(["taken", "free"])
+
+    assert freed_cells(matrix, matrix) == []
+
+
+def test_next_interval_tightens_on_a_change_or_in_the_rush():
+    args = Input(watch_min_interval=15, watch_max_interval=300)
+
+    assert next_interval(args, 200, changed=True, rush=False, cost=0.1) == 15
+    assert next_interval(args, 200, changed=False, rush=True, cost=0.1) == 15
+
+
+def test_next_interval_backs_off_up_to_the_maximum():
+    args = Input(watch_min_interval=15, watch_max_interval=300)
+
+    assert next_interval(args, 20, changed=False, rush=False, cost=0.1) == 20 * BACKOFF_FACTOR
+    assert next_interval(args, 250, changed=False, rush=False, cost=0.1) == 300
+
+
+def test_next_interval_leaves_room_for_slow_polls():
+    args = Input(watch_min_interval=15, watch_max_interval=300)
+
+    assert next_interval(args, 20, changed=True, rush=False, cost=2) == 2 * COST_RATIO